@@ -7,18 +7,51 @@ Only shares gaze data DURING stages, not between stages
 import pylink
 import os
 import platform
-import random
 import time
 import sys
+import math
 import numpy as np
 import socket
 import threading
 import json
-import queue
+import struct
+import select
+import errno
+import collections
+import csv
+import zlib
+import ctypes
+from dataclasses import dataclass
 from psychopy import visual, core, event, monitors, gui
 from EyeLinkCoreGraphicsPsychoPy import EyeLinkCoreGraphicsPsychoPy
 from string import ascii_letters, digits
 
+# Sync message codec: orjson when installed, stdlib json otherwise
+try:
+    import orjson
+
+    def encode_message(message):
+        return orjson.dumps(message, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+    decode_message = orjson.loads
+except ImportError:
+    def encode_message(message):
+        return json.dumps(message, separators=(',', ':')).encode('utf-8')
+
+    def decode_message(data):
+        return json.loads(data.decode('utf-8'))
+
+# numba is optional: without it the kernels below run as plain Python.
+# Compiled kernels are cached next to this script, so only the first run pays for the JIT
+os.environ.setdefault('NUMBA_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'numba_cache'))
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
 # Network Configuration
 LOCAL_IP = "100.1.1.11"  # Computer B's IP
 REMOTE_IP = "100.1.1.10"  # Computer A's IP
@@ -26,10 +59,67 @@ GAZE_PORT = 8889
 SEND_PORT = 8888
 SYNC_PORT = 5555
 
+# Gaze send batching: flush after GAZE_BATCH_SIZE samples or GAZE_BATCH_INTERVAL
+# seconds since the last flush, whichever comes first
+GAZE_BATCH_SIZE = 16
+GAZE_BATCH_INTERVAL = 0.010
+
+# Gaze packet wire format: computer id, x, y, valid, tracker sample time (ms)
+GAZE_FMT = struct.Struct('<cddBd')
+
+# Requested kernel buffer size for the UDP sockets. Linux silently caps this at
+# net.core.rmem_max / net.core.wmem_max, so raise those on the lab machines:
+#   sudo sysctl -w net.core.rmem_max=12582912
+#   sudo sysctl -w net.core.wmem_max=12582912
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024
+
+# CPU placement (Linux only): keep the PsychoPy render loop and the gaze receive
+# thread on separate cores. SCHED_FIFO needs root or CAP_SYS_NICE, e.g.
+#   sudo setcap cap_sys_nice+ep $(readlink -f $(which python))
+# For best results also steer the NIC's IRQ to GAZE_RECV_CPU via
+# /proc/irq/<n>/smp_affinity_list.
+MAIN_THREAD_CPU = 0
+GAZE_RECV_CPU = 2
+GAZE_RECV_PRIORITY = 20
+
 # Global variables
 el_tracker = None
 win = None
-remote_gaze_data = {'x': 0, 'y': 0, 'valid': False, 'timestamp': 0}
+
+@dataclass
+class RemoteGaze:
+    """Latest gaze sample received from the partner computer"""
+    x: float = 0
+    y: float = 0
+    valid: bool = False
+    timestamp: float = 0  # Partner's tracker clock, ms; not comparable to our clocks
+    receipt_time: float = 0  # Our time.perf_counter() when the packet arrived
+
+remote_gaze_data = RemoteGaze()
+remote_gaze_lock = threading.Lock()  # Written by the receive thread, read by the frame loop
+
+def snapshot_remote_gaze():
+    """Return a consistent (x, y, valid, timestamp, receipt_time) copy of the partner's gaze"""
+    with remote_gaze_lock:
+        return (remote_gaze_data.x, remote_gaze_data.y, remote_gaze_data.valid,
+                remote_gaze_data.timestamp, remote_gaze_data.receipt_time)
+
+@dataclass
+class LocalGaze:
+    """Latest local tracker sample, in tracker screen coordinates"""
+    x: float = 0
+    y: float = 0
+    valid: bool = False
+    sample_time: float = -1
+
+local_gaze_data = LocalGaze()
+local_gaze_lock = threading.Lock()  # Written by the gaze poll thread, read by the frame loop
+
+def snapshot_local_gaze():
+    """Return a consistent (x, y, valid, sample_time) copy of the local gaze"""
+    with local_gaze_lock:
+        return local_gaze_data.x, local_gaze_data.y, local_gaze_data.valid, local_gaze_data.sample_time
+
 network_stats = {'sent': 0, 'received': 0, 'errors': 0}
 
 # IMPORTANT: Gaze sharing control
@@ -129,21 +219,138 @@ session_folder = os.path.join(results_folder, session_identifier)
 if not os.path.exists(session_folder):
     os.makedirs(session_folder)
 
+# Batched UDP I/O - Linux sendmmsg() via ctypes, plain sendto() loop elsewhere
+class IOVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+class SockAddrIn(ctypes.Structure):
+    _fields_ = [('sin_family', ctypes.c_ushort), ('sin_port', ctypes.c_uint16),
+                ('sin_addr', ctypes.c_uint32), ('sin_zero', ctypes.c_char * 8)]
+
+class MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(IOVec)), ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+class MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', MsgHdr), ('msg_len', ctypes.c_uint)]
+
+libc = None
+if sys.platform.startswith('linux'):
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.sendmmsg  # Missing on very old glibc
+        libc.recvmmsg
+    except (OSError, AttributeError):
+        libc = None
+
+MSG_WAITFORONE = 0x10000  # From <linux/socket.h>
+SYNC_RECV_BATCH = 32  # Max sync messages pulled per recvmmsg() call
+SYNC_RECV_BUFSIZE = 1024
+
+def make_sockaddr_in(ip, port):
+    """Build a struct sockaddr_in for the given IPv4 address"""
+    addr = SockAddrIn()
+    addr.sin_family = socket.AF_INET
+    addr.sin_port = socket.htons(port)
+    addr.sin_addr = int.from_bytes(socket.inet_aton(ip), sys.byteorder)
+    return addr
+
+# Pre-built sendmmsg() arrays; only iov_base/iov_len change per flush
+gaze_batch = collections.deque()
+last_gaze_flush = 0.0
+gaze_dest_addr = make_sockaddr_in(REMOTE_IP, SEND_PORT)
+gaze_iovecs = (IOVec * GAZE_BATCH_SIZE)()
+gaze_mmsgs = (MMsgHdr * GAZE_BATCH_SIZE)()
+for i in range(GAZE_BATCH_SIZE):
+    gaze_mmsgs[i].msg_hdr.msg_name = ctypes.addressof(gaze_dest_addr)
+    gaze_mmsgs[i].msg_hdr.msg_namelen = ctypes.sizeof(gaze_dest_addr)
+    gaze_mmsgs[i].msg_hdr.msg_iov = ctypes.pointer(gaze_iovecs[i])
+    gaze_mmsgs[i].msg_hdr.msg_iovlen = 1
+
+def make_udp_socket(nonblocking=False):
+    """Create a UDP socket, close-on-exec and optionally non-blocking, with the flags
+    passed to socket() itself on Linux; other platforms fall back to a short timeout"""
+    flags = getattr(socket, 'SOCK_CLOEXEC', 0)
+    if nonblocking:
+        flags |= getattr(socket, 'SOCK_NONBLOCK', 0)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM | flags)
+    if nonblocking and not hasattr(socket, 'SOCK_NONBLOCK'):
+        sock.settimeout(0.001)  # Windows/macOS: near non-blocking via timeout
+    return sock
+
+def set_socket_buffers(sock, size=SOCKET_BUFFER_SIZE):
+    """Enlarge the socket's send/receive buffers and report what the kernel granted"""
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, size)
+    except OSError as e:
+        print(f"⚠️  Could not set socket buffers: {e}")
+    rcvbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    sndbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+    print(f"✓ Socket buffers: recv {rcvbuf // 1024} KB, send {sndbuf // 1024} KB")
+
+IPTOS_LOWDELAY = 0x10
+GAZE_SO_PRIORITY = 6  # Highest priority an unprivileged process may set
+IP_MTU_DISCOVER = getattr(socket, 'IP_MTU_DISCOVER', 10)  # Linux value; not exported by Python
+IP_PMTUDISC_DONT = 0
+
+def set_low_latency(sock):
+    """Mark a send socket's packets low-delay and skip path MTU probing; each option is
+    best-effort since SO_PRIORITY and IP_MTU_DISCOVER are Linux-only"""
+    options = [
+        ('IP_TOS', socket.IPPROTO_IP, getattr(socket, 'IP_TOS', None), IPTOS_LOWDELAY),
+        ('SO_PRIORITY', socket.SOL_SOCKET, getattr(socket, 'SO_PRIORITY', None), GAZE_SO_PRIORITY),
+    ]
+    if sys.platform.startswith('linux'):
+        options.append(('IP_MTU_DISCOVER', socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DONT))
+    for name, level, option, value in options:
+        if option is None:
+            continue
+        try:
+            sock.setsockopt(level, option, value)
+        except OSError as e:
+            print(f"⚠️  Could not set {name}: {e}")
+
+def pin_current_thread(cpu, priority=None, label='Main'):
+    """Pin the calling thread to one CPU and optionally run it SCHED_FIFO.
+    Skipped off Linux and on machines without a spare core for the gaze thread"""
+    if not hasattr(os, 'sched_setaffinity') or (os.cpu_count() or 1) <= max(MAIN_THREAD_CPU, GAZE_RECV_CPU):
+        return
+    try:
+        os.sched_setaffinity(0, {cpu})  # 0 = calling thread
+    except OSError as e:
+        print(f"⚠️  {label} thread affinity not set: {e}")
+        return
+    if priority is not None:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+        except OSError as e:
+            print(f"⚠️  {label} thread pinned to CPU {cpu}, priority not raised: {e}")
+            return
+    print(f"✓ {label} thread pinned to CPU {cpu}")
+
+pin_current_thread(MAIN_THREAD_CPU)  # Threads started later inherit this unless they re-pin
+
 def setup_network():
     """Setup UDP sockets for sending and receiving gaze data"""
     global send_socket, receive_socket
    
     try:
         # Socket for sending data to Computer A
-        send_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        send_socket = make_udp_socket()
         send_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        set_socket_buffers(send_socket)
         print(f"✓ Send socket created for {REMOTE_IP}:{SEND_PORT}")
        
         # Socket for receiving data from Computer A
-        receive_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Non-blocking: an empty recvfrom raises BlockingIOError with SOCK_NONBLOCK (Linux),
+        # or socket.timeout after 1 ms on the settimeout fallback used on other platforms
+        receive_socket = make_udp_socket(nonblocking=True)
         receive_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        set_socket_buffers(receive_socket)
         receive_socket.bind((LOCAL_IP, GAZE_PORT))
-        receive_socket.settimeout(0.001)  # Non-blocking with short timeout
         print(f"✓ Receive socket bound to {LOCAL_IP}:{GAZE_PORT}")
        
         return True
@@ -229,6 +436,10 @@ if 'Darwin' in platform.system() and use_retina:
     scn_width = int(scn_width/2.0)
     scn_height = int(scn_height/2.0)
 
+# Screen centre in pixels, for converting tracker coordinates to window coordinates
+_HALF_W = scn_width * 0.5
+_HALF_H = scn_height * 0.5
+
 # Configure EyeLink graphics
 el_coords = "screen_pixel_coords = 0 0 %d %d" % (scn_width - 1, scn_height - 1)
 el_tracker.sendCommand(el_coords)
@@ -256,13 +467,21 @@ print("✓ Graphics environment ready")
 print("\n4. CREATING VISUAL ELEMENTS")
 print("-" * 30)
 
-# Local gaze marker (Computer B's own gaze) - Green theme
-local_gaze_marker = visual.Circle(win=win, radius=20, fillColor='limegreen', lineColor='darkgreen', lineWidth=2)
-local_gaze_sparkle1 = visual.Circle(win=win, radius=15, fillColor='lightgreen', lineColor='white', lineWidth=1)
-
-# Remote gaze marker (Computer A's gaze) - Blue theme
-remote_gaze_marker = visual.Circle(win=win, radius=20, fillColor='deepskyblue', lineColor='navy', lineWidth=2)
-remote_gaze_sparkle1 = visual.Circle(win=win, radius=15, fillColor='lightblue', lineColor='white', lineWidth=1)
+# Both gaze markers and their sparkles in one ElementArrayStim. Each circle is an
+# outline-coloured disc with a slightly smaller fill disc on top, in draw order:
+#   0-1 local marker, 2-3 local sparkle  (Computer B's own gaze) - Green theme
+#   4-5 remote marker, 6-7 remote sparkle (Computer A's gaze)     - Blue theme
+gaze_earray = visual.ElementArrayStim(win, nElements=8, elementTex=None, elementMask='circle',
+                                      sizes=[42, 38, 31, 29, 42, 38, 31, 29],
+                                      colors=[[0, 100, 0], [50, 205, 50],       # darkgreen / limegreen
+                                              [255, 255, 255], [144, 238, 144], # white / lightgreen
+                                              [0, 0, 128], [0, 191, 255],       # navy / deepskyblue
+                                              [255, 255, 255], [173, 216, 230]],# white / lightblue
+                                      colorSpace='rgb255', sfs=0)
+_gaze_xys = np.zeros((8, 2), dtype=np.float32)  # Written in place by the update_*_gaze_display functions
+_gaze_xys_dirty = True                # Set when _gaze_xys changed since it was last pushed to gaze_earray
+_gaze_opacities = np.ones(8)
+_remote_marker_shown = True           # Whether elements 4-7 are currently opaque
 
 # Status display (smaller to make room for game)
 status_background = visual.Rect(win=win, width=scn_width*0.9, height=60,
@@ -276,14 +495,16 @@ status_text = visual.TextStim(win, text='', pos=[0, scn_height//2 - 40], color='
 
 
 def draw_ui_elements():
-    """Draw status bar, legend, and corners"""
+    """Draw status bar, legend, and corners.
+    Not called by any frame loop; needs create_missing_ui_elements() to have run"""
     # Draw corners
     for corner in corners:
         corner.draw()
    
     # Draw status
     status_background.draw()
-    remote_age = time.time() - remote_gaze_data.get('timestamp', 0)
+    _, _, _, _, remote_receipt_time = snapshot_remote_gaze()
+    remote_age = time.perf_counter() - remote_receipt_time
     remote_status = "CONNECTED" if remote_age < 0.1 else f"DELAYED"
    
     status_text.setText(
@@ -343,11 +564,20 @@ def clear_screen(win):
     win.clearBuffer()
     win.flip()
 
+def set_text_if_changed(stim, text):
+    """Update a TextStim only when its string changes (setText re-renders the texture)"""
+    if stim.text != text:
+        stim.setText(text)
+
+# Message box stimuli, built once and reused by every show_msg() call
+_MSG_BG = visual.Rect(win, width=scn_width*0.7, height=scn_height*0.6,
+                      fillColor='lightcyan', lineColor='darkgreen', lineWidth=5)
+_MSG_TXT = visual.TextStim(win, '', color='darkgreen', wrapWidth=scn_width*0.6,
+                           height=22, bold=True)
+_msg_size = np.empty(2)
+
 def show_msg(win, text, wait_for_keypress=True):
-    msg_background = visual.Rect(win, width=scn_width*0.7, height=scn_height*0.6,
-                                fillColor='lightcyan', lineColor='darkgreen', lineWidth=5)
-    msg = visual.TextStim(win, text, color='darkgreen', wrapWidth=scn_width*0.6,
-                         height=22, bold=True)
+    _MSG_TXT.text = text
    
     clear_screen(win)
    
@@ -356,21 +586,23 @@ def show_msg(win, text, wait_for_keypress=True):
         while True:
             current_time = core.getTime()
             pulse = 0.95 + 0.05 * np.sin((current_time - start_time) * 3)
-            msg_background.setSize([scn_width*0.7*pulse, scn_height*0.6*pulse])
+            _msg_size[0] = scn_width*0.7*pulse
+            _msg_size[1] = scn_height*0.6*pulse
+            _MSG_BG.size = _msg_size
            
             win.clearBuffer()
 
-            msg_background.draw()
-            msg.draw()
-            win.flip()
-            core.wait(0.016)
+            _MSG_BG.draw()
+            _MSG_TXT.draw()
+            win.flip()  # Paced by vsync
            
             keys = event.getKeys()
             if keys:
                 break
     else:
-        msg_background.draw()
-        msg.draw()
+        _MSG_BG.size = (scn_width*0.7, scn_height*0.6)
+        _MSG_BG.draw()
+        _MSG_TXT.draw()
         win.flip()
    
     clear_screen(win)
@@ -395,12 +627,15 @@ def terminate_task():
    
     # Close network sockets
     try:
+        stop_gaze_receiver()
         send_socket.close()
         receive_socket.close()
         print("✓ Network sockets closed")
     except:
         pass
    
+    stop_gaze_poller()
+   
     if el_tracker and el_tracker.isConnected():
         try:
             if el_tracker.isRecording():
@@ -499,14 +734,16 @@ class RobustSyncClient:
         self.port = port
         self.socket = None
         self.running = False
-        self.message_queue = queue.Queue()
+        # Single producer (receive thread), single consumer (experiment loop):
+        # deque append/popleft are atomic, the Event only serves as a wakeup
+        self.message_queue = collections.deque()
+        self._new_msg = threading.Event()
        
     def start_client(self):
         """Start the synchronization client with robust settings"""
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 65536)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 65536)
+        set_socket_buffers(self.socket)
        
 #        # Platform-specific optimizations
 #        try:
@@ -529,6 +766,7 @@ class RobustSyncClient:
        
         self.socket.settimeout(0.1)  # FIXED: Longer timeout
         self.running = True
+        self._setup_receive_batch()
        
         # Start receiving thread
         self.receive_thread = threading.Thread(target=self._receive_messages, daemon=True)
@@ -547,8 +785,7 @@ class RobustSyncClient:
        
         for attempt in range(retry_count):
             try:
-                message_json = json.dumps(message, separators=(',', ':'))
-                message_bytes = message_json.encode('utf-8')
+                message_bytes = encode_message(message)
                 self.socket.sendto(message_bytes, (self.server_ip, self.port))
                 print(f"B: Sent {message_type} (attempt {attempt + 1})")
                 return True
@@ -557,52 +794,144 @@ class RobustSyncClient:
                 time.sleep(0.1)
         return False
                
+    def _setup_receive_batch(self):
+        """Allocate the recvmmsg() buffers once; stays None off Linux"""
+        self.recv_mmsgs = None
+        if libc is None:
+            return
+        self.recv_buffers = [ctypes.create_string_buffer(SYNC_RECV_BUFSIZE) for _ in range(SYNC_RECV_BATCH)]
+        self.recv_addrs = (SockAddrIn * SYNC_RECV_BATCH)()
+        self.recv_iovecs = (IOVec * SYNC_RECV_BATCH)()
+        self.recv_mmsgs = (MMsgHdr * SYNC_RECV_BATCH)()
+        for i in range(SYNC_RECV_BATCH):
+            self.recv_iovecs[i].iov_base = ctypes.addressof(self.recv_buffers[i])
+            self.recv_iovecs[i].iov_len = SYNC_RECV_BUFSIZE
+            hdr = self.recv_mmsgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self.recv_addrs[i])
+            hdr.msg_namelen = ctypes.sizeof(SockAddrIn)
+            hdr.msg_iov = ctypes.pointer(self.recv_iovecs[i])
+            hdr.msg_iovlen = 1
+
+    def _receive_batch(self):
+        """Return the (data, addr) datagrams waiting on the socket, up to SYNC_RECV_BATCH
+        per recvmmsg() call on Linux, or a single recvfrom() elsewhere"""
+        if self.recv_mmsgs is None:
+            return [self.socket.recvfrom(1024)]
+       
+        # The socket timeout makes the fd non-blocking, so wait for data first
+        ready, _, _ = select.select([self.socket], [], [], self.socket.gettimeout())
+        if not ready:
+            return []
+       
+        count = libc.recvmmsg(self.socket.fileno(), self.recv_mmsgs, SYNC_RECV_BATCH, MSG_WAITFORONE, None)
+        if count < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            raise OSError(err, os.strerror(err))
+       
+        batch = []
+        for i in range(count):
+            mmsg = self.recv_mmsgs[i]
+            sender = self.recv_addrs[i]
+            data = ctypes.string_at(self.recv_buffers[i], mmsg.msg_len)
+            addr = (socket.inet_ntoa(sender.sin_addr.to_bytes(4, sys.byteorder)), socket.ntohs(sender.sin_port))
+            batch.append((data, addr))
+            mmsg.msg_hdr.msg_namelen = ctypes.sizeof(SockAddrIn)  # Kernel overwrites it
+        return batch
+               
     def _receive_messages(self):
         """Receive messages with better error handling"""
         while self.running:
             try:
-                data, addr = self.socket.recvfrom(1024)
-                receipt_time = time.perf_counter()
-               
-                message = json.loads(data.decode('utf-8'))
-                message['sender_addr'] = addr
-                message['receipt_time'] = receipt_time
-               
-                self.message_queue.put(message)
-                print(f"B: Received {message.get('type', 'unknown')}")
-               
-                # Auto-respond to ping
-                if message.get('type') == 'ping':
-                    self.send_message('pong', {'client_ready': True})
-               
+                batch = self._receive_batch()
             except socket.timeout:
                 continue
             except Exception as e:
                 if self.running:
                     print(f"B: Receive error: {e}")
+                continue
+           
+            receipt_time = time.perf_counter()
+            for data, addr in batch:
+                try:
+                    message = decode_message(data)
+                    message['sender_addr'] = addr
+                    message['receipt_time'] = receipt_time
+                   
+                    self.message_queue.append(message)
+                    self._new_msg.set()
+                    print(f"B: Received {message.get('type', 'unknown')}")
                    
+                    # Auto-respond to ping
+                    if message.get('type') == 'ping':
+                        self.send_message('pong', {'client_ready': True})
+                except Exception as e:
+                    if self.running:
+                        print(f"B: Receive error: {e}")
+                   
+    def _take_message(self, expected_type):
+        """Pop the oldest queued message of expected_type, leaving the rest queued in order"""
+        skipped = []
+        found = None
+        while True:
+            try:
+                message = self.message_queue.popleft()
+            except IndexError:
+                break
+            if message.get('type') == expected_type:
+                found = message
+                break
+            skipped.append(message)
+        self.requeue(skipped)
+        return found
+       
     def wait_for_message(self, expected_type, timeout=30):
         """Wait for specific message with longer timeout"""
-        start_time = time.perf_counter()
-        while time.perf_counter() - start_time < timeout:
-            try:
-                message = self.message_queue.get(timeout=0.01)
-                if message.get('type') == expected_type:
-                    return message
-                else:
-                    # Put it back if it's not what we want
-                    self.message_queue.put(message)
-            except queue.Empty:
-                continue
+        deadline = time.perf_counter() + timeout
+        while True:
+            self._new_msg.clear()
+            message = self._take_message(expected_type)
+            if message is not None:
+                return message
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            self._new_msg.wait(remaining)
         print(f"B: Timeout waiting for {expected_type}")
         return None
        
     def get_message(self, timeout=0.1):
         """Get any message with reasonable timeout"""
-        try:
-            return self.message_queue.get(timeout=timeout)
-        except queue.Empty:
-            return None
+        deadline = time.perf_counter() + timeout
+        while True:
+            self._new_msg.clear()  # Cleared before checking, so a later append still wakes us
+            try:
+                return self.message_queue.popleft()
+            except IndexError:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return None
+            self._new_msg.wait(remaining)
+
+    def take_all(self, expected_type):
+        """Pop every queued message of expected_type without blocking, leaving the
+        rest queued in order; the whole queue is scanned, so no backlog hides a match"""
+        taken, kept = [], []
+        popleft = self.message_queue.popleft
+        for _ in range(len(self.message_queue)):
+            try:
+                message = popleft()
+            except IndexError:
+                break
+            (taken if message.get('type') == expected_type else kept).append(message)
+        self.requeue(kept)
+        return taken
+
+    def requeue(self, messages):
+        """Put messages back at the front of the queue, keeping their order"""
+        self.message_queue.extendleft(reversed(messages))
            
     def close(self):
         """Close the client"""
@@ -617,13 +946,16 @@ def setup_gaze_network():
     global send_socket, receive_socket
    
     try:
-        send_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        send_socket = make_udp_socket()
         send_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        set_socket_buffers(send_socket)
+        set_low_latency(send_socket)
        
-        receive_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receive_socket = make_udp_socket()
         receive_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        set_socket_buffers(receive_socket)
         receive_socket.bind((LOCAL_IP, GAZE_PORT))
-        receive_socket.settimeout(0.001)
+        # Left blocking: the receive thread parks in recvfrom() until a packet arrives
        
         # Start receiving thread
         receive_thread = threading.Thread(target=receive_gaze_data, daemon=True)
@@ -635,64 +967,161 @@ def setup_gaze_network():
         print(f"✗ Gaze network setup failed: {e}")
         return False
 
-def send_gaze_data(gaze_x, gaze_y, valid=True):
-    """Send gaze data only when sharing is active"""
+def send_gaze_data(gaze_x, gaze_y, sample_time, valid=True,
+                   _pack=GAZE_FMT.pack, _batch=gaze_batch, _perf_counter=time.perf_counter):
+    """Send gaze data only when sharing is active; sample_time is the tracker's own timestamp.
+    The underscore defaults bind hot-path lookups as locals and are not meant to be passed"""
     global network_stats, GAZE_SHARING_ACTIVE
    
     if not GAZE_SHARING_ACTIVE:
+        _batch.clear()  # Drop samples left over from the previous stage
         return  # Don't send when not in a stage
    
     try:
-        data = {
-            'x': float(gaze_x),
-            'y': float(gaze_y),
-            'valid': valid,
-            'timestamp': time.time(),
-            'computer': 'B'
-        }
-       
-        message = json.dumps(data).encode('utf-8')
-        send_socket.sendto(message, (REMOTE_IP, SEND_PORT))
-        network_stats['sent'] += 1
-       
+        _batch.append(_pack(b'B', gaze_x, gaze_y, 1 if valid else 0, sample_time))
+
+        if (len(_batch) >= GAZE_BATCH_SIZE or
+                _perf_counter() - last_gaze_flush >= GAZE_BATCH_INTERVAL):
+            flush_gaze_batch()
+
     except Exception as e:
         network_stats['errors'] += 1
 
+def flush_gaze_batch():
+    """Send all queued gaze packets, in a single sendmmsg() call on Linux"""
+    global last_gaze_flush
+
+    last_gaze_flush = time.perf_counter()
+    count = len(gaze_batch)
+    if count == 0:
+        return
+
+    packets = [gaze_batch.popleft() for _ in range(count)]
+
+    if libc is None:
+        for packet in packets:
+            try:
+                send_socket.sendto(packet, (REMOTE_IP, SEND_PORT))
+                network_stats['sent'] += 1
+            except OSError:
+                network_stats['errors'] += 1
+        return
+
+    for i, packet in enumerate(packets):
+        gaze_iovecs[i].iov_base = ctypes.cast(packet, ctypes.c_void_p).value
+        gaze_iovecs[i].iov_len = len(packet)
+
+    # sendmmsg() may send fewer than requested; resend the remainder
+    offset = 0
+    fd = send_socket.fileno()
+    while offset < count:
+        sent = libc.sendmmsg(fd, ctypes.byref(gaze_mmsgs, offset * ctypes.sizeof(MMsgHdr)),
+                             count - offset, 0)
+        if sent <= 0:
+            network_stats['errors'] += count - offset
+            break
+        network_stats['sent'] += sent
+        offset += sent
+
 def receive_gaze_data():
     """Continuously receive gaze data"""
-    global remote_gaze_data, network_stats
+    global network_stats
+   
+    pin_current_thread(GAZE_RECV_CPU, GAZE_RECV_PRIORITY, label='Gaze receive')
+   
+    # Bind everything the loop touches to locals once; the socket is already
+    # set up by setup_gaze_network() when this thread starts
+    sock = receive_socket
+    recvfrom = sock.recvfrom
+    unpack_from = GAZE_FMT.unpack_from
+    perf_counter = time.perf_counter
+    remote = remote_gaze_data
+    lock = remote_gaze_lock
+    stats = network_stats
    
     while True:
         try:
-            data, addr = receive_socket.recvfrom(1024)
-            gaze_info = json.loads(data.decode('utf-8'))
+            data, addr = recvfrom(1024)
+            if not data:
+                break  # Empty wake-up datagram from stop_gaze_receiver()
+            computer, x, y, valid, timestamp = unpack_from(data)
            
-            if gaze_info.get('computer') == 'A':
-                remote_gaze_data.update(gaze_info)
-                network_stats['received'] += 1
+            if computer == b'A':
+                with lock:
+                    remote.x = x
+                    remote.y = y
+                    remote.valid = bool(valid)
+                    remote.timestamp = timestamp
+                    remote.receipt_time = perf_counter()
+                stats['received'] += 1
                
-        except socket.timeout:
-            continue
         except Exception as e:
-            network_stats['errors'] += 1
+            if sock.fileno() == -1:
+                break  # Socket closed during shutdown
+            stats['errors'] += 1
             time.sleep(0.001)
 
-def update_local_gaze_display():
-    """Update local gaze marker"""
-    global local_gaze_stats
-   
-    if not GAZE_SHARING_ACTIVE:
-        return  # Don't process when not sharing
-   
-    local_gaze_stats['total_attempts'] += 1
+def stop_gaze_receiver():
+    """Wake the blocking gaze receive thread with an empty datagram so it exits"""
+    try:
+        send_socket.sendto(b'', (LOCAL_IP, GAZE_PORT))
+    except OSError:
+        pass
+
+# Sine lookup table for the sparkle animation; cosine is the same table a quarter turn ahead
+_LUT_SIZE = 1024
+_LUT_SCALE = _LUT_SIZE / (2 * np.pi)
+_SIN_LUT = np.sin(np.linspace(0, 2*np.pi, _LUT_SIZE, endpoint=False)).tolist()  # Plain floats, no ndarray boxing
+_COS_LUT = _SIN_LUT[_LUT_SIZE//4:] + _SIN_LUT[:_LUT_SIZE//4]
+
+def fastsin(x):
+    return _SIN_LUT[int(x * _LUT_SCALE) & (_LUT_SIZE - 1)]
+
+def fastcos(x):
+    return _COS_LUT[int(x * _LUT_SCALE) & (_LUT_SIZE - 1)]
+
+@njit(cache=True, fastmath=True)
+def _gaze_kernel(gx, gy, half_w, half_h, t):
+    """Tracker coordinates to window coordinates, plus the local sparkle position"""
+    x = gx - half_w
+    y = half_h - gy
+    sx = x + 15.0 * math.sin(t * 3.0)
+    sy = y + 10.0 * math.cos(t * 4.0)
+    return x, y, sx, sy
+
+_gaze_kernel(0.0, 0.0, 1.0, 1.0, 0.0)  # Compile (or load from cache) now, not on the first gaze frame
+
+_last_sample_time = -1  # Tracker timestamp of the last sample processed
+_last_gaze_print = 0.0
+GAZE_PRINT_INTERVAL = 1.0  # Seconds between local gaze debug prints
+
+# Tracker polling runs on its own thread so the 1 kHz sample rate is not tied to the display refresh
+GAZE_POLL_INTERVAL = 0.0005  # Seconds between getNewestSample() calls while sharing
+gaze_poll_running = False
+gaze_poll_thread = None
+
+def poll_local_gaze(_stats=local_gaze_stats, _state=local_gaze_data, _lock=local_gaze_lock):
+    """Read the newest tracker sample, publish it for the display and share it
+    (underscore defaults are local aliases, not parameters)"""
+    global _last_sample_time, _last_gaze_print
    
     try:
         sample = el_tracker.getNewestSample()
     except:
         sample = None
    
+    # getNewestSample() returns the same sample until the tracker delivers a
+    # new one; nothing to publish or send for a repeat
+    sample_time = sample.getTime() if sample is not None else None
+    if sample_time == _last_sample_time:
+        return
+   
+    # Counted only past the repeat check, like the valid/missing counts below
+    _stats['total_attempts'] += 1
+   
     if sample is not None:
-        local_gaze_stats['samples_received'] += 1
+        _last_sample_time = sample_time
+        _stats['samples_received'] += 1
        
         gaze_data = None
         if sample.isRightSample():
@@ -707,52 +1136,119 @@ def update_local_gaze_display():
                 pass
        
         if gaze_data and gaze_data[0] != pylink.MISSING_DATA and gaze_data[1] != pylink.MISSING_DATA:
-            local_gaze_stats['valid_gaze_data'] += 1
+            _stats['valid_gaze_data'] += 1
            
-            # Convert coordinates and update display
-            gaze_x = (gaze_data[0] - scn_width/2 )
-            gaze_y = (scn_height/2 - gaze_data[1])
-
-            print(gaze_x)
-            print(gaze_y)
+            with _lock:
+                _state.x = gaze_data[0]
+                _state.y = gaze_data[1]
+                _state.valid = True
+                _state.sample_time = sample_time
+
+            now = time.perf_counter()
+            if now - _last_gaze_print >= GAZE_PRINT_INTERVAL:
+                print(f"B: Local gaze {gaze_data[0] - _HALF_W:.1f}, {_HALF_H - gaze_data[1]:.1f}")
+                _last_gaze_print = now
            
-            if True: # abs(gaze_x) <= scn_width/2 and abs(gaze_y) <= scn_height/2:
-                local_gaze_marker.setPos([gaze_x, gaze_y])
-               
-                # Animate sparkles
-                sparkle_time = core.getTime()
-                sparkle_offset1 = 15 * np.sin(sparkle_time * 3)
-                sparkle_offset2 = 10 * np.cos(sparkle_time * 4)
-                local_gaze_sparkle1.setPos([gaze_x + sparkle_offset1, gaze_y + sparkle_offset2])
-               
-                # Send gaze data
-                send_gaze_data(gaze_data[0], gaze_data[1], True)
+            # Send gaze data
+            send_gaze_data(gaze_data[0], gaze_data[1], sample_time, True)
         else:
-            local_gaze_stats['missing_data'] += 1
-            send_gaze_data(0, 0, False)
+            _stats['missing_data'] += 1
+            send_gaze_data(0, 0, sample_time, False)
+
+def gaze_poll_loop():
+    """Gaze poll thread body: poll the tracker while sharing is active, idle otherwise"""
+    pin_current_thread(GAZE_RECV_CPU, label='Gaze poll')  # Off the render core, no RT priority
+   
+    while gaze_poll_running:
+        if not GAZE_SHARING_ACTIVE:
+            time.sleep(0.005)
+            continue
+        try:
+            poll_local_gaze()
+        except Exception:
+            pass  # Keep polling; one bad sample must not end the thread
+        time.sleep(GAZE_POLL_INTERVAL)
+
+def start_gaze_poller():
+    """Start the tracker poll thread; call once recording has started"""
+    global gaze_poll_running, gaze_poll_thread
+   
+    if gaze_poll_thread is not None and gaze_poll_thread.is_alive():
+        return
+    gaze_poll_running = True
+    gaze_poll_thread = threading.Thread(target=gaze_poll_loop, daemon=True)
+    gaze_poll_thread.start()
+
+def stop_gaze_poller():
+    """Stop the tracker poll thread before recording stops"""
+    global gaze_poll_running
+   
+    gaze_poll_running = False
+    if gaze_poll_thread is not None:
+        gaze_poll_thread.join(timeout=1)
+
+def update_local_gaze_display(_kernel=_gaze_kernel, _get_time=core.getTime):
+    """Update local gaze marker from the poll thread's latest sample
+    (underscore defaults are local aliases, not parameters)"""
+    global _gaze_xys_dirty
+    if not GAZE_SHARING_ACTIVE:
+        return  # Don't process when not sharing
+   
+    gaze_x, gaze_y, valid, _ = snapshot_local_gaze()
+    if not valid:
+        return
+   
+    # Convert coordinates and animate sparkles
+    gaze_x, gaze_y, sparkle_x, sparkle_y = _kernel(gaze_x, gaze_y, _HALF_W, _HALF_H, _get_time())
+   
+    _gaze_xys[0:2, 0] = gaze_x
+    _gaze_xys[0:2, 1] = gaze_y
+   
+    _gaze_xys[2:4, 0] = sparkle_x
+    _gaze_xys[2:4, 1] = sparkle_y
+    _gaze_xys_dirty = True
 
 def update_remote_gaze_display():
     """Update remote gaze marker"""
-    global remote_gaze_data
-   
+    global _gaze_xys_dirty
     if not GAZE_SHARING_ACTIVE:
         return  # Don't display when not sharing
    
-    if remote_gaze_data.get('valid', False):
+    remote_x, remote_y, remote_valid, _, _ = snapshot_remote_gaze()
+    if remote_valid:
         try:
-            gaze_x = (remote_gaze_data['x'] - scn_width/2 )
-            gaze_y = (scn_height/2 - remote_gaze_data['y'] )
+            gaze_x = remote_x - _HALF_W
+            gaze_y = _HALF_H - remote_y
            
-            remote_gaze_marker.setPos([gaze_x, gaze_y])
+            _gaze_xys[4:6, 0] = gaze_x
+            _gaze_xys[4:6, 1] = gaze_y
            
             sparkle_time = core.getTime()
-            sparkle_offset1 = 12 * np.cos(sparkle_time * 3.5)
-            sparkle_offset2 = 8 * np.sin(sparkle_time * 4.5)
-            remote_gaze_sparkle1.setPos([gaze_x + sparkle_offset1, gaze_y + sparkle_offset2])
+            sparkle_offset1 = 12 * fastcos(sparkle_time * 3.5)
+            sparkle_offset2 = 8 * fastsin(sparkle_time * 4.5)
+            _gaze_xys[6:8, 0] = gaze_x + sparkle_offset1
+            _gaze_xys[6:8, 1] = gaze_y + sparkle_offset2
+            _gaze_xys_dirty = True
            
         except Exception as e:
             pass
 
+def draw_gaze_markers():
+    """Draw local and (if valid) remote gaze markers in a single draw call"""
+    global _remote_marker_shown, _gaze_xys_dirty
+   
+    remote_valid = remote_gaze_data.valid
+    if remote_valid != _remote_marker_shown:
+        _gaze_opacities[4:] = 1.0 if remote_valid else 0.0
+        gaze_earray.opacities = _gaze_opacities
+        _remote_marker_shown = remote_valid
+   
+    # Only hand the buffer over when it changed; the xys setter copies it
+    if _gaze_xys_dirty:
+        gaze_earray.xys = _gaze_xys
+        _gaze_xys_dirty = False
+    gaze_earray.draw()
+
 # Additional global variables for memory game
 images = {
     'face': [],
@@ -761,9 +1257,32 @@ images = {
     'car': []
 }
 conditions = {}
+# Preloaded ImageStim per entry of images[category]; None for placeholders
+image_stims = {
+    'face': [],
+    'limb': [],
+    'house': [],
+    'car': []
+}
+IS_PLACEHOLDER = {}  # category -> bool array over images[category], built by load_all_images()
+
+# Placeholder square colour per category
+CATEGORY_COLORS = {
+    'face': 'orange',
+    'limb': 'green',
+    'house': 'purple',
+    'car': 'yellow'
+}
 grid_stimuli = []
-grid_covers = []
+grid_covers = None       # ElementArrayStim: gray cover fills
+grid_cover_edges = None  # ElementArrayStim: white outlines drawn underneath
+_cover_opacities = np.ones(64)
+_hidden_cover = None     # Cell whose cover is currently hidden for the recall target
+placeholder_rects = {}  # category -> Rect shared by every placeholder cell of that category
+placeholder_texts = {}  # category -> letter TextStim, likewise shared
 grid_positions = []
+grid_positions_np = None  # (64, 2) array of the same cell centres
+GRID_LAYOUT = []          # Per-cell geometry for the trial log; fixed for the session
 target_cover = None
 question_mark = None
 target_category = None
@@ -775,6 +1294,33 @@ CATEGORY_MAP = {
     2: 'house',
     3: 'car'
 }
+# Same mapping as an array, so a whole condition array converts with one gather
+CATEGORY_LUT = np.array([CATEGORY_MAP[i] for i in range(max(CATEGORY_MAP) + 1)], dtype=object)
+
+# Response keys -> categories; responses travel upper-case, so both cases are listed
+RESPONSE_MAP = {
+    'f': 'face', 'F': 'face',
+    'l': 'limb', 'L': 'limb',
+    'h': 'house', 'H': 'house',
+    'c': 'car', 'C': 'car'
+}
+RESPONSE_KEYS = ['f', 'l', 'h', 'c']
+VALID_KEYS = RESPONSE_KEYS + ['escape']
+
+# Stable per-category offsets for image selection (crc32, unlike hash(), is not salted per process)
+CATEGORY_CRC = {category: zlib.crc32(category.encode()) & 0xFFFF for category in CATEGORY_MAP.values()}
+
+@njit(cache=True, fastmath=True)
+def pick_indices(seed, cat_hashes, cat_counts):
+    """Deterministic image index per category from one 32-bit LCG step on seed + offset"""
+    out = np.empty(len(cat_counts), np.int64)
+    for i in range(len(cat_counts)):
+        state = (seed + cat_hashes[i]) & 0xFFFFFFFF
+        state = (1664525 * state + 1013904223) & 0xFFFFFFFF
+        out[i] = (state >> 8) % max(cat_counts[i], 1)
+    return out
+
+pick_indices(0, np.zeros(1, np.int64), np.ones(1, np.int64))  # Warm the JIT before the first trial
 
 #!/usr/bin/env python3
 """
@@ -819,6 +1365,33 @@ def load_conditions():
                      0, 1, 3, 2, 3, 2, 1, 0, 1, 0, 2, 3, 3, 1, 0, 2]]
         }
 
+def compute_grid_geometry(grid_size=8):
+    """Return (grid_spacing, cell_size, start_x, start_y) for a square grid_size x grid_size grid"""
+    available_width = scn_width * 0.8
+    available_height = scn_height * 0.7  # Leave space for UI elements
+   
+    # Use the smaller spacing to maintain square grid
+    grid_spacing = min(available_width / grid_size, available_height / grid_size)
+    cell_size = int(grid_spacing * 0.85)  # Cells are 85% of spacing
+   
+    # Centre of the top-left cell, with the grid centred on screen
+    start_x = -(grid_size - 1) * grid_spacing / 2
+    start_y = (grid_size - 1) * grid_spacing / 2
+    return grid_spacing, cell_size, start_x, start_y
+
+# One ImageStim per (absolute path, size) for the whole session, so each image
+# file is decoded and uploaded to the GPU exactly once
+_image_stim_cache = {}
+
+def get_or_create_image_stim(path, size):
+    """Return the session-wide ImageStim for an image file at the given size"""
+    key = (os.path.abspath(path), tuple(size))
+    stim = _image_stim_cache.get(key)
+    if stim is None:
+        stim = visual.ImageStim(win, image=path, size=size)
+        _image_stim_cache[key] = stim
+    return stim
+
 def load_all_images():
     """Load all images from stimuli folder"""
     global images
@@ -858,103 +1431,94 @@ def load_all_images():
                 images[category_key].append(f"placeholder_{category_key}_{i}")
    
     print("✓ Image paths loaded")
-
-def create_synchronized_grid(condition_array, seed):
-    """Create 8x8 grid from 64-element condition array using shared seed"""
-    global grid_stimuli, grid_covers, grid_positions, target_cover, cell_size
    
-    # Clear previous grid data
-    grid_stimuli = []
-    grid_covers = []
-    grid_positions = []
+    # Preload every image now so the first trial doesn't pay for decode + upload
+    _, cell_size, _, _ = compute_grid_geometry()
+    for category_key, paths in images.items():
+        IS_PLACEHOLDER[category_key] = np.array([path.startswith('placeholder_') for path in paths], dtype=bool)
+        image_stims[category_key] = [None if placeholder else
+                                     get_or_create_image_stim(path, (cell_size, cell_size))
+                                     for path, placeholder in zip(paths, IS_PLACEHOLDER[category_key])]
+    print("✓ Image stimuli preloaded")
+
+def init_grid_pool():
+    """Build the per-cell stimuli once; trials only reconfigure them"""
+    global grid_positions, grid_positions_np, GRID_LAYOUT, grid_covers, grid_cover_edges, _hidden_cover, placeholder_rects, placeholder_texts, target_cover, question_mark, cell_size
    
     # Grid setup - 8x8 logical grid with 1:1 physical mapping
-    logical_grid_size = 8
+    grid_spacing, cell_size, start_x, start_y = compute_grid_geometry(8)
    
-    # Calculate grid spacing
-    available_width = scn_width * 0.8
-    available_height = scn_height * 0.7  # Leave space for UI elements
+    # 8x8 grid with 1:1 logical-to-physical mapping, row by row
+    xs = start_x + np.arange(8) * grid_spacing
+    ys = start_y - np.arange(8) * grid_spacing
+    xx, yy = np.meshgrid(xs, ys)
+    grid_positions_np = np.column_stack((xx.ravel(), yy.ravel()))
+    grid_positions = [tuple(pos) for pos in grid_positions_np.tolist()]
+    GRID_LAYOUT = [{'position_index': i, 'center_x': pos[0], 'center_y': pos[1]}
+                   for i, pos in enumerate(grid_positions)]
    
-    grid_spacing_x = available_width / logical_grid_size
-    grid_spacing_y = available_height / logical_grid_size
+    # All 64 covers in two draw calls: a white square slightly larger than the cell
+    # under a gray one slightly smaller, which gives the 2px white outline
+    grid_cover_edges = visual.ElementArrayStim(win, nElements=64, elementTex=None, elementMask=None,
+                                               sizes=cell_size + 2, xys=grid_positions_np,
+                                               colors=[[1, 1, 1]]*64, colorSpace='rgb', sfs=0)
+    grid_covers = visual.ElementArrayStim(win, nElements=64, elementTex=None, elementMask=None,
+                                          sizes=cell_size - 2, xys=grid_positions_np,
+                                          colors=[[0, 0, 0]]*64, colorSpace='rgb', sfs=0)
+    _hidden_cover = None
    
-    # Use the smaller spacing to maintain square grid
-    grid_spacing = min(grid_spacing_x, grid_spacing_y)
-    cell_size = int(grid_spacing * 0.85)  # Cells are 85% of spacing
+    # One coloured square + letter per category, for categories without images;
+    # cells share them and set the position when drawing
+    placeholder_rects = {category: visual.Rect(win=win, width=cell_size, height=cell_size,
+                                               fillColor=color, lineColor='white', lineWidth=2)
+                         for category, color in CATEGORY_COLORS.items()}
+    placeholder_texts = {category: visual.TextStim(win, text=category[0].upper(), color='black',
+                                                   height=cell_size//4, bold=True)
+                         for category in CATEGORY_COLORS}
+   
+    # Create special target cover (bright red for recall phase)
+    target_cover = visual.Rect(win=win, width=cell_size, height=cell_size,
+                              fillColor='red', lineColor='white', lineWidth=3,
+                              pos=[0, 0])  # Position will be set during recall phase
+    question_mark = visual.TextStim(win, text='?', pos=[0, 0], color='white',
+                                    height=cell_size//2, bold=True)
+   
+    print(f"✓ Grid pool created: {len(grid_positions)} cells")
+
+def configure_grid_for_trial(condition_array, seed):
+    """Fill the pooled 8x8 grid from a 64-element condition array using shared seed"""
+    global grid_stimuli
    
-    # Calculate grid position (center of screen)
-    start_x = -(logical_grid_size - 1) * grid_spacing / 2
-    start_y = (logical_grid_size - 1) * grid_spacing / 2
+    grid_stimuli = []
    
     # Hard difficulty: condition is a 64-element array representing 8x8 pattern
-    condition_categories = [CATEGORY_MAP[num] for num in condition_array]
+    condition_categories = CATEGORY_LUT[np.asarray(condition_array, dtype=np.intp)]
    
     # ========== SYNCHRONIZED IMAGE SELECTION ==========
     # Get unique categories and sort them for consistent ordering across computers
     unique_categories = sorted(list(set(condition_categories)))
     
     # Generate deterministic image selections for each category
-    selected_images = {}
-    for i, category in enumerate(unique_categories):
-        if len(images[category]) > 0:
-            # Use seed + category-specific offset for deterministic selection
-            image_seed = seed + hash(category) % 10000  # Hash category name for consistent offset
-            random.seed(image_seed)
-            selected_images[category] = random.randint(0, len(images[category]) - 1)
-        else:
-            selected_images[category] = 0
-    
-    # Reset to original seed for any remaining grid operations
-    random.seed(seed)
+    hashes = np.array([CATEGORY_CRC[c] for c in unique_categories], dtype=np.int64)
+    counts = np.array([len(images[c]) for c in unique_categories], dtype=np.int64)
+    picks = pick_indices(seed, hashes, counts)
+    selected_images = dict(zip(unique_categories, picks.tolist()))
     # ====================================================
    
-    # Create 8x8 grid with 1:1 logical-to-physical mapping
-    for row in range(8):
-        for col in range(8):
-            category = condition_categories[row * 8 + col]
-            selected_image_idx = selected_images[category]
-            
-            # Calculate position for this single cell
-            x_pos = start_x + col * grid_spacing
-            y_pos = start_y - row * grid_spacing
-           
-            grid_positions.append((x_pos, y_pos))
-           
-            # Create stimulus
-            if images[category][selected_image_idx].startswith('placeholder_'):
-                # Use colored rectangle
-                category_colors = {
-                    'face': 'orange',
-                    'limb': 'green',
-                    'house': 'purple',
-                    'car': 'yellow'
-                }
-                stimulus = visual.Rect(win=win, width=cell_size, height=cell_size,
-                                     fillColor=category_colors[category],
-                                     lineColor='white', lineWidth=2,
-                                     pos=[x_pos, y_pos])
-               
-                text_stim = visual.TextStim(win, text=category[0].upper(), pos=[x_pos, y_pos],
-                                          color='black', height=cell_size//4, bold=True)
-               
-                grid_stimuli.append({'rect': stimulus, 'text': text_stim, 'category': category, 'image_type': 'rect'})
-            else:
-                # Use actual image
-                img_stim = visual.ImageStim(win, image=images[category][selected_image_idx],
-                                          pos=[x_pos, y_pos], size=(cell_size, cell_size))
-               
-                grid_stimuli.append({'image': img_stim, 'category': category, 'image_type': 'image'})
+    # 1:1 mapping: cell i is logical cell i
+    for i, pos in enumerate(grid_positions):
+        category = condition_categories[i]
+        selected_image_idx = selected_images[category]
+       
+        if IS_PLACEHOLDER[category][selected_image_idx]:
+            # Use colored rectangle
+            grid_stimuli.append({'rect': placeholder_rects[category], 'text': placeholder_texts[category],
+                                 'pos': pos, 'category': category, 'image_type': 'rect'})
+        else:
+            # Use actual image; shared by every cell showing this image
+            img_stim = image_stims[category][selected_image_idx]
            
-            # Create cover
-            cover = visual.Rect(win=win, width=cell_size, height=cell_size,
-                              fillColor='gray', lineColor='white', lineWidth=2,
-                              pos=[x_pos, y_pos])
-            grid_covers.append(cover)
-   
-    # Create special target cover (bright red for recall phase)
-    target_cover = visual.Rect(win=win, width=cell_size, height=cell_size,
-                              fillColor='red', lineColor='white', lineWidth=3,
-                              pos=[0, 0])  # Position will be set during recall phase
+            grid_stimuli.append({'image': img_stim, 'pos': pos, 'category': category, 'image_type': 'image'})
    
     print(f"✓ Synchronized 8x8 grid created with seed {seed}")
 
@@ -962,9 +1526,12 @@ def draw_study_grid():
     """Draw the uncovered grid during study phase"""
     for stim in grid_stimuli:
         if stim['image_type'] == 'rect':
+            stim['rect'].pos = stim['pos']
             stim['rect'].draw()
+            stim['text'].pos = stim['pos']
             stim['text'].draw()
         else:
+            stim['image'].pos = stim['pos']
             stim['image'].draw()
 
 # 1. ADD NEW GLOBAL VARIABLE (add this near the top with other globals)
@@ -973,10 +1540,17 @@ target_square_color = 'red'  # Controls the color of the target square
 # 2. MODIFY draw_recall_grid() FUNCTION (replace the existing function)
 def draw_recall_grid(target_pos, square_color='red'):
     """Draw covered grid with target marker in specified color"""
-    # Draw all covers except target position
-    for i, cover in enumerate(grid_covers):
-        if i != target_pos:
-            cover.draw()
+    global _hidden_cover
+   
+    # Draw all covers except target position; opacities only change with the target
+    if target_pos != _hidden_cover:
+        _cover_opacities.fill(1)
+        _cover_opacities[target_pos] = 0
+        grid_cover_edges.opacities = _cover_opacities
+        grid_covers.opacities = _cover_opacities
+        _hidden_cover = target_pos
+    grid_cover_edges.draw()
+    grid_covers.draw()
    
     # Draw target cover with specified color and question mark
     target_pos_coords = grid_positions[target_pos]
@@ -985,27 +1559,262 @@ def draw_recall_grid(target_pos, square_color='red'):
     target_cover.draw()
    
     # Draw question mark at target position
-    question_mark = visual.TextStim(win, text='?', pos=target_pos_coords,
-                                   color='white', height=cell_size//2, bold=True)
+    question_mark.setPos(target_pos_coords)
     question_mark.draw()
  
 def evaluate_response(response, correct_category):
     """Check if response is correct"""
-    response_mapping = {
-        'f': 'face',
-        'l': 'limb',
-        'h': 'house',
-        'c': 'car'
+    return RESPONSE_MAP.get(response) == correct_category
+
+# Trial log columns; the fixed grid geometry goes to a sidecar JSON instead
+TRIAL_LOG_FIELDS = [
+    'trial', 'target_position', 'correct_category', 'client_response', 'client_rt',
+    'first_responder', 'first_response', 'trial_score', 'total_score', 'grid_categories',
+    'target_coordinates'
+]
+
+def open_trial_log(prefix):
+    """Open the per-trial CSV (one row written per trial) and save the session's grid layout beside it"""
+    stem = f'{prefix}_{time.strftime("%Y%m%d_%H%M%S")}'
+    with open(stem + '_layout.json', 'w') as layout_file:
+        json.dump({'cell_size': cell_size,
+                   'grid_positions': grid_positions,
+                   'grid_layout': GRID_LAYOUT,
+                   'screen_dimensions': [int(scn_width), int(scn_height)]}, layout_file)
+    log_file = open(stem + '.csv', 'w', newline='')
+    log_writer = csv.DictWriter(log_file, fieldnames=TRIAL_LOG_FIELDS)
+    log_writer.writeheader()
+    return log_file, log_writer
+
+# ========== STAGE HANDLERS ==========
+# One function per server message type, looked up through HANDLERS by the main loop.
+# ctx carries the state shared between stages (sync client, text stims, trial
+# parameters, data log); a handler sets ctx['aborted'] when escape ended the task.
+
+def _handle_grid_display(message, ctx):
+    """Stage 1: show the study grid built from the server's trial parameters"""
+    global current_trial, GAZE_SHARING_ACTIVE
+    sync_client = ctx['sync_client']
+    stage_text = ctx['stage_text']
+   
+    # ========== STAGE 1: GRID DISPLAY ==========
+    print("B: Stage 1 - Grid Display")
+    GAZE_SHARING_ACTIVE = True
+   
+    # Extract trial parameters from server
+    trial_data = message.get('data', {})
+    current_trial = trial_data.get('trial_number', 0)
+    trial_seed = trial_data.get('seed', 0)
+    condition_array = trial_data.get('condition_array', [])
+    ctx['target_position'] = trial_data.get('target_position', 0)
+    ctx['correct_category'] = trial_data.get('target_category', '')
+   
+    # Create identical grid using server's parameters
+    configure_grid_for_trial(condition_array, trial_seed)
+   
+    # Acknowledge sync
+    sync_client.send_message('stage_sync_ack', {'ready': True})
+   
+    # Display grid for 5 seconds WITH gaze sharing
+    stage_clock = core.Clock()
+    while stage_clock.getTime() < 7.0:
+        update_local_gaze_display()
+        update_remote_gaze_display()
+       
+        win.clearBuffer()
+       
+        # Draw grid
+        draw_study_grid()
+        set_text_if_changed(stage_text, f"Trial {current_trial} - Study the grid ({math.ceil(7.0 - stage_clock.getTime())}s)")
+        stage_text.draw()
+
+        # Draw gaze markers
+        if GAZE_SHARING_ACTIVE:
+            draw_gaze_markers()
+       
+        win.flip()  # Paced by vsync
+       
+        keys = event.getKeys(['escape'])
+        if 'escape' in keys:
+            GAZE_SHARING_ACTIVE = False
+            sync_client.send_message('end_experiment')
+            terminate_task()
+            ctx['aborted'] = True
+            return
+   
+    GAZE_SHARING_ACTIVE = False
+
+def _handle_response(message, ctx):
+    """Stage 2: collect this side's response and wait for the server's"""
+    global GAZE_SHARING_ACTIVE
+    sync_client = ctx['sync_client']
+    stage_text = ctx['stage_text']
+    response_prompt = ctx['response_prompt']
+    target_position = ctx['target_position']
+   
+    # ========== STAGE 2: RESPONSE COLLECTION ==========
+    print("B: Stage 2 - Response Collection")
+    GAZE_SHARING_ACTIVE = False
+   
+    # Reset target square color for new trial
+    event.clearEvents()  # Clear any leftover keypresses
+
+    target_square_color = 'red'
+   
+    # Acknowledge sync
+    sync_client.send_message('stage_sync_ack', {'ready': True})
+   
+    # Response collection WITH gaze sharing and color feedback
+    client_response = None
+    client_rt = None
+    first_responder = None
+   
+    response_clock = core.Clock()
+    response_received = {'server': False, 'client': False}
+   
+    while not (response_received['server'] and response_received['client']):
+#        update_local_gaze_display()
+#        update_remote_gaze_display()
+       
+        win.clearBuffer()
+       
+        # Draw gaze markers
+        if GAZE_SHARING_ACTIVE:
+            draw_gaze_markers()
+       
+        # Draw covered grid with target (color changes after first response)
+        draw_recall_grid(target_position, target_square_color)
+        response_prompt.draw()
+        set_text_if_changed(stage_text, f"Trial {current_trial} - What was at the red position?")
+        stage_text.draw()
+       
+        win.flip()
+       
+        # Check for client response: one key poll per frame; escape always ends the
+        # task, and response keys only count until this side has responded
+        keys = event.getKeys(VALID_KEYS, timeStamped=response_clock)
+        if keys:
+            if any(key == 'escape' for key, _ in keys):
+                GAZE_SHARING_ACTIVE = False
+                sync_client.send_message('end_experiment')
+                terminate_task()
+                ctx['aborted'] = True
+                return
+            if not response_received['client']:
+                key, rt = keys[0]
+                client_response = key.upper()
+                client_rt = rt
+                response_received['client'] = True
+               
+                # Check if this is the first response
+                if first_responder is None:
+                    first_responder = 'client'
+                    target_square_color = 'green'  # Turn square green!
+                    print("B: First response detected - square turned green")
+               
+                sync_client.send_message('response_update', {
+                    'responder': 'client',
+                    'response': client_response,
+                    'rt': client_rt
+                })
+       
+        # Check for server response without blocking the frame; other messages stay queued in order
+        for resp_msg in sync_client.take_all('response_update'):
+            resp_data = resp_msg.get('data', {})
+            if resp_data.get('responder') == 'server':
+                if not response_received['server']:
+                    response_received['server'] = True
+                   
+                    # Check if this is the first response
+                    if first_responder is None:
+                        first_responder = 'server'
+                        target_square_color = 'green'  # Turn square green!
+                        print("B: First response (from server) detected - square turned green")
+   
+    ctx['client_response'] = client_response
+    ctx['client_rt'] = client_rt
+    GAZE_SHARING_ACTIVE = False
+
+def _handle_feedback(message, ctx):
+    """Stage 3: show the server's verdict, then log the trial"""
+    global GAZE_SHARING_ACTIVE
+    sync_client = ctx['sync_client']
+    stage_text = ctx['stage_text']
+    feedback_text = ctx['feedback_text']
+    target_position = ctx['target_position']
+   
+    # ========== STAGE 3: FEEDBACK ==========
+    print("B: Stage 3 - Feedback")
+    GAZE_SHARING_ACTIVE = False
+   
+    # Extract feedback data
+    feedback_data = message.get('data', {})
+    trial_score = feedback_data.get('trial_score', 0)
+    total_score = ctx['total_score'] = feedback_data.get('total_score', 0)
+    first_responder = feedback_data.get('first_responder', '')
+    first_response = feedback_data.get('first_response', '')
+    correct_category = ctx['correct_category'] = feedback_data.get('correct_category', '')
+   
+    # Acknowledge sync
+    sync_client.send_message('stage_sync_ack', {'ready': True})
+   
+    # Display feedback for 1 second WITH gaze sharing (UNCHANGED)
+    # Feedback text is fixed for the whole display, so render it once up front
+    set_text_if_changed(feedback_text, f"+{trial_score}")
+    feedback_text.setColor('green' if trial_score > 0 else 'red')
+    set_text_if_changed(stage_text, f"Answer: {correct_category} | First: {first_responder} ({first_response})")
+    # Gaze sharing is off and the text is fixed, so nothing changes during
+    # feedback: draw the frame once and hold it for the rest of the second
+    feedback_clock = core.Clock()
+    win.clearBuffer()
+    feedback_text.draw()
+    stage_text.draw()
+    win.flip()
+    core.wait(max(0.0, 1.0 - feedback_clock.getTime()))
+   
+    GAZE_SHARING_ACTIVE = False
+   
+    win.clearBuffer()
+    win.flip()
+   
+   
+    # Log data
+    trial_log = {
+        'trial': current_trial,
+        'target_position': target_position,
+        'correct_category': correct_category,
+        'client_response': ctx['client_response'],
+        'client_rt': ctx['client_rt'],
+        'first_responder': first_responder,
+        'first_response': first_response,
+        'trial_score': trial_score,
+        'total_score': total_score,
+        'grid_categories': json.dumps([stim['category'] for stim in grid_stimuli]),
+        'target_coordinates': grid_positions[target_position] if target_position < len(grid_positions) else None
     }
-    return response_mapping.get(response.lower()) == correct_category
+    ctx['log_writer'].writerow(trial_log)
+    ctx['log_file'].flush()  # Keep completed trials on disk even if the session aborts
+   
+    print(f"B: Trial {current_trial} completed. Score: {trial_score}")
+
+def _handle_end_experiment(message, ctx):
+    """Server finished the session"""
+    print("B: Experiment ended by server")
+    ctx['running'] = False
+
+HANDLERS = {
+    'stage_grid_display': _handle_grid_display,
+    'stage_response': _handle_response,
+    'stage_feedback': _handle_feedback,
+    'end_experiment': _handle_end_experiment,
+}
 
 def run_synchronized_experiment():
     """Main experiment with stage synchronization - MODIFIED for grid memory task"""
-    global current_trial, total_trials, GAZE_SHARING_ACTIVE
-   
     # Load conditions and images
     load_conditions()
     load_all_images()
+    init_grid_pool()
    
     # Setup networks
     if not setup_gaze_network():
@@ -1031,263 +1840,40 @@ def run_synchronized_experiment():
    
     # Start recording
     el_tracker.startRecording(1, 1, 1, 1)
+    start_gaze_poller()
    
     # Create visual elements for grid task
     stage_text = visual.TextStim(win, text="", height=24, pos=(0, -scn_height//2 + 50), color='white', bold=True)
     response_prompt = visual.TextStim(win, text="Press F=Face, L=Limb, H=House, C=Car", height=24, pos=(0, scn_height//2 - 100), color='yellow', bold=True)
     feedback_text = visual.TextStim(win, text="", height=48, pos=(0, 0), bold=True)
    
-    data_log = []
-    total_score = 0
+    log_file, log_writer = open_trial_log('sync_client_B')
+    ctx = {
+        'sync_client': sync_client,
+        'stage_text': stage_text,
+        'response_prompt': response_prompt,
+        'feedback_text': feedback_text,
+        'log_file': log_file,
+        'log_writer': log_writer,
+        'total_score': 0,
+        'target_position': 0,
+        'correct_category': '',
+        'client_response': None,
+        'client_rt': None,
+        'running': True,
+        'aborted': False,
+    }
    
     # Main experiment loop
-    experiment_running = True
-    while experiment_running:
+    while ctx['running']:
         message = sync_client.get_message(timeout=0.1)
        
         if message:
-            msg_type = message.get('type')
-           
-            if msg_type == 'stage_grid_display':
-                # ========== STAGE 1: GRID DISPLAY ==========
-                print("B: Stage 1 - Grid Display")
-                GAZE_SHARING_ACTIVE = True
-               
-                # Extract trial parameters from server
-                trial_data = message.get('data', {})
-                current_trial = trial_data.get('trial_number', 0)
-                trial_seed = trial_data.get('seed', 0)
-                condition_array = trial_data.get('condition_array', [])
-                target_position = trial_data.get('target_position', 0)
-                correct_category = trial_data.get('target_category', '')
-               
-                # Create identical grid using server's parameters
-                create_synchronized_grid(condition_array, trial_seed)
-               
-                # Acknowledge sync
-                sync_client.send_message('stage_sync_ack', {'ready': True})
-               
-                # Display grid for 5 seconds WITH gaze sharing
-                stage_clock = core.Clock()
-                while stage_clock.getTime() < 7.0:
-                    update_local_gaze_display()
-                    update_remote_gaze_display()
-                   
-                    win.clearBuffer()
-                   
-
-                   
-                    # Draw grid
-                    draw_study_grid()
-                    stage_text.setText(f"Trial {current_trial} - Study the grid ({7.0 - stage_clock.getTime():.1f}s)")
-                    stage_text.draw()
-
-                    # Draw gaze markers
-                    if GAZE_SHARING_ACTIVE:
-                        local_gaze_marker.draw()
-                        local_gaze_sparkle1.draw()
-                        if remote_gaze_data.get('valid', False):
-                            remote_gaze_marker.draw()
-                            remote_gaze_sparkle1.draw()
-                           
-                   
-                    win.flip()
-                    core.wait(0.016)
-
-                   
-                    keys = event.getKeys(['escape'])
-                    if 'escape' in keys:
-                        GAZE_SHARING_ACTIVE = False
-                        sync_client.send_message('end_experiment')
-                        terminate_task()
-                        return
-               
-                GAZE_SHARING_ACTIVE = False
-               
-            elif msg_type == 'stage_response':
-                # ========== STAGE 2: RESPONSE COLLECTION ==========
-                print("B: Stage 2 - Response Collection")
-                GAZE_SHARING_ACTIVE = False
-               
-                # Reset target square color for new trial
-                event.clearEvents()  # Clear any leftover keypresses
-
-                target_square_color = 'red'
-               
-                # Acknowledge sync
-                sync_client.send_message('stage_sync_ack', {'ready': True})
-               
-                # Response collection WITH gaze sharing and color feedback
-                client_response = None
-                client_rt = None
-                first_responder = None
-                first_response = None
-               
-                response_clock = core.Clock()
-                response_received = {'server': False, 'client': False}
-               
-                while not (response_received['server'] and response_received['client']):
-#                    update_local_gaze_display()
-#                    update_remote_gaze_display()
-                   
-                    win.clearBuffer()
-                   
-                    # Draw gaze markers
-                    if GAZE_SHARING_ACTIVE:
-                        local_gaze_marker.draw()
-                        local_gaze_sparkle1.draw()
-                        if remote_gaze_data.get('valid', False):
-                            remote_gaze_marker.draw()
-                            remote_gaze_sparkle1.draw()
-                   
-                    # Draw covered grid with target (color changes after first response)
-                    draw_recall_grid(target_position, target_square_color)
-                    response_prompt.draw()
-                    stage_text.setText(f"Trial {current_trial} - What was at the red position?")
-                    stage_text.draw()
-                   
-                    win.flip()
-                   
-                    # Check for client response
-                    if not response_received['client']:
-                        keys = event.getKeys(['f', 'l', 'h', 'c', 'escape'], timeStamped=response_clock)
-                        if keys:
-                            key, rt = keys[0]
-                            if key == 'escape':
-                                GAZE_SHARING_ACTIVE = False
-                                sync_client.send_message('end_experiment')
-                                terminate_task()
-                                return
-                            elif key in ['f', 'l', 'h', 'c']:
-                                client_response = key.upper()
-                                client_rt = rt
-                                response_received['client'] = True
-                               
-                                # Check if this is the first response
-                                if first_responder is None:
-                                    first_responder = 'client'
-                                    first_response = client_response
-                                    target_square_color = 'green'  # Turn square green!
-                                    print("B: First response detected - square turned green")
-                               
-                                sync_client.send_message('response_update', {
-                                    'responder': 'client',
-                                    'response': client_response,
-                                    'rt': client_rt
-                                })
-                    else:
-                        # Still check for escape even after responding
-                        keys = event.getKeys(['f', 'l', 'h', 'c', 'escape'])
-                        if keys:
-                            for key_info in keys:
-                                key = key_info[0] if isinstance(key_info, tuple) else key_info
-                                if key == 'escape':
-                                    GAZE_SHARING_ACTIVE = False
-                                    sync_client.send_message('end_experiment')
-                                    terminate_task()
-                                    return
-                                # Silently discard f, l, h, c keys
-
-                   
-                    # Check for server response
-                    resp_msg = sync_client.wait_for_message('response_update', timeout=0.1)#get_message(timeout=0.1)
-                    if resp_msg:
-                        if resp_msg.get('type') == 'response_update':
-                            resp_data = resp_msg.get('data', {})
-                            if resp_data.get('responder') == 'server':
-                                if not response_received['server']:
-                                    response_received['server'] = True
-                                   
-                                    # Check if this is the first response
-                                    if first_responder is None:
-                                        first_responder = 'server'
-                                        first_response = resp_data.get('response')
-                                        target_square_color = 'green'  # Turn square green!
-                                        print("B: First response (from server) detected - square turned green")
-#                        else:
-#                            sync_client.message_queue.put(resp_msg)
-                       
-               
-                GAZE_SHARING_ACTIVE = False
-               
-            elif msg_type == 'stage_feedback':
-                # ========== STAGE 3: FEEDBACK ==========
-                print("B: Stage 3 - Feedback")
-                GAZE_SHARING_ACTIVE = False
-               
-                # Extract feedback data
-                feedback_data = message.get('data', {})
-                trial_score = feedback_data.get('trial_score', 0)
-                total_score = feedback_data.get('total_score', 0)
-                first_responder = feedback_data.get('first_responder', '')
-                first_response = feedback_data.get('first_response', '')
-                correct_category = feedback_data.get('correct_category', '')
-               
-                # Acknowledge sync
-                sync_client.send_message('stage_sync_ack', {'ready': True})
-               
-                # Display feedback for 1 second WITH gaze sharing (UNCHANGED)
-                feedback_clock = core.Clock()
-                while feedback_clock.getTime() < 1.0:
-                    print(feedback_clock.getTime())
-#                    update_local_gaze_display()
-#                    update_remote_gaze_display()
-                   
-                    win.clearBuffer()
-                   
-                    # Draw gaze markers
-                    if GAZE_SHARING_ACTIVE:
-                        local_gaze_marker.draw()
-                        local_gaze_sparkle1.draw()
-                        if remote_gaze_data.get('valid', False):
-                            remote_gaze_marker.draw()
-                            remote_gaze_sparkle1.draw()
-                   
-                    # Draw feedback
-                    feedback_text.setText(f"+{trial_score}")
-                    feedback_text.setColor('green' if trial_score > 0 else 'red')
-                    stage_text.setText(f"Answer: {correct_category} | First: {first_responder} ({first_response})")
-                   
-                    feedback_text.draw()
-                    stage_text.draw()
-                   
-                    win.flip()
-                    core.wait(0.016)
-               
-                GAZE_SHARING_ACTIVE = False
-               
-                win.clearBuffer()
-                win.flip()
-               
-               
-                spatial_info = {
-                'cell_size': cell_size,
-                'grid_positions': grid_positions,
-                'grid_layout': [{'position_index': i, 'center_x': pos[0], 'center_y': pos[1],
-                'category': grid_stimuli[i]['category']} for i, pos in enumerate(grid_positions)],
-                'screen_dimensions': [scn_width, scn_height] }
-                # Log data
-                trial_log = {
-                    'trial': current_trial,
-                    'target_position': target_position,
-                    'correct_category': correct_category,
-                    'client_response': client_response if 'client_response' in locals() else None,
-                    'client_rt': client_rt if 'client_rt' in locals() else None,
-                    'first_responder': first_responder,
-                    'first_response': first_response,
-                    'trial_score': trial_score,
-                    'total_score': total_score,
-                    'spatial_layout': spatial_info,
-                    'target_coordinates': grid_positions[target_position] if target_position < len(grid_positions) else None
-                }
-                data_log.append(trial_log)
-               
-                print(f"B: Trial {current_trial} completed. Score: {trial_score}")
-               
-            elif msg_type == 'end_experiment':
-                print("B: Experiment ended by server")
-                experiment_running = False
-                break
+            handler = HANDLERS.get(message.get('type'))
+            if handler is not None:
+                handler(message, ctx)
+                if ctx['aborted']:
+                    return
        
 #        # Show waiting screen when not in a stage
 #        if not GAZE_SHARING_ACTIVE:
@@ -1302,12 +1888,10 @@ def run_synchronized_experiment():
 #                terminate_task()
 #                break
    
-    # Save data
-    import pandas as pd
-    df = pd.DataFrame(data_log)
-    filename = f'sync_client_B_{time.strftime("%Y%m%d_%H%M%S")}.csv'
-    df.to_csv(filename, index=False)
+    # Trial rows were written as they completed
+    log_file.close()
    
+    total_score = ctx['total_score']
     final_score_pct = (total_score / total_trials) * 100 if total_trials > 0 else 0
     print(f"B: Experiment complete! Score: {total_score}/{total_trials} ({final_score_pct:.1f}%)")
    
@@ -1,9 +1,15 @@
 from psychopy import visual, core, event, gui, monitors
+from psychopy.hardware import keyboard
 import random
 import numpy as np
+import math
 import os
 import json
 import csv
+import queue
+import threading
+import time
+from collections import deque
 from datetime import datetime
 import pylink
 import sys
@@ -38,6 +44,16 @@ CATEGORIES = {
     'f': 'face',
     'l': 'limb'
 }
+KEY_FOR_CATEGORY = {category: key for key, category in CATEGORIES.items()}
+
+# CSV columns for the trial data file, including stage timing
+DATA_FIELDNAMES = [
+    'trial', 'difficulty', 'condition', 'target_category', 
+    'target_image_index', 'target_position', 'correct_key', 
+    'user_response', 'response_time', 'correct', 'timestamp',
+    'stage1_start_time', 'stage1_end_time', 
+    'stage1_start_timestamp', 'stage1_end_timestamp', 'stage1_duration'
+]
 
 class MemoryGame:
     def __init__(self):
@@ -57,6 +73,12 @@ class MemoryGame:
         # Get screen dimensions
         self.scn_width, self.scn_height = self.win.size
         
+        # Measured refresh rate, so timed displays can count flips instead of polling a clock
+        self.frame_rate = self.win.getActualFrameRate() or 60.0
+        
+        # Keyboard polled every frame in the gaze loops (PsychToolbox backend where available)
+        self.kb = keyboard.Keyboard()
+        
         # Setup EyeLink graphics after window creation
         self._setup_eyelink_graphics()
         
@@ -83,14 +105,31 @@ class MemoryGame:
             'missing_data': 0
         }
         
+        # Valid gaze samples queued by the polling thread, drained once per frame
+        self._gaze_pending = deque(maxlen=64)
+        self._center = np.array([self.scn_width/2, self.scn_height/2], dtype=np.float32)
+        self._flip_y = np.array([1, -1], dtype=np.float32)
+        self._gaze_lock = threading.Lock()
+        self._gaze_running = False
+        self._gaze_thread = None
+        
+        # Trial messages queued for the polling thread, and a lock so only one thread talks to pylink
+        self._message_queue = queue.Queue()
+        self._tracker_lock = threading.Lock()
+        
         # Load conditions from JSON
         self.conditions = self._load_conditions()
         
         # Load all images from stimuli folder
         self.images = self._load_all_images()
         
-        # Create gray covers
-        self.gray_cover = visual.Rect(self.win, width=80, height=80, fillColor='gray')
+        # The same stims as a (category number, image index) object array, so a whole
+        # grid is looked up with one fancy index instead of 64 dict-then-list lookups
+        self.image_counts = np.array([len(self.images[CATEGORY_MAP[ci]]) for ci in range(len(CATEGORY_MAP))])
+        self.images_array = np.empty((len(CATEGORY_MAP), self.image_counts.max()), dtype=object)
+        for ci, category in CATEGORY_MAP.items():
+            for k, stim in enumerate(self.images[category]):
+                self.images_array[ci, k] = stim
         
         # Create question mark
         self.question_mark = visual.TextStim(
@@ -110,16 +149,49 @@ class MemoryGame:
             wrapWidth=800
         )
         
+        # Per-phase text, built once; trials only change .text/.color
+        self.response_instr = visual.TextStim(
+            self.win,
+            text="What was under the ?? marker?\nH=House, C=Car, F=Face, L=Limb",
+            pos=(0, -350),
+            color='white',
+            height=20
+        )
+        self.feedback_text = visual.TextStim(
+            self.win,
+            text='',
+            color='white',
+            height=30
+        )
+        self.round_text = visual.TextStim(
+            self.win,
+            text='',
+            color='white',
+            height=30
+        )
+        
         # Score tracking
         self.score = 0
         self.current_round = 0
         
-        # Data collection
-        self.trial_data = []
+        # Data collection: each trial's row is written as soon as the trial ends
+        self._open_data_file()
         
         # Calculate grid positions
         self.grid_positions = self._calculate_grid_positions()
         
+        # Create gray covers: all 64 as one element array, drawn in a single call
+        self.cover_stim = visual.ElementArrayStim(
+            self.win,
+            nElements=64,
+            xys=self.grid_positions,
+            sizes=80,
+            elementTex=None,
+            elementMask=None,
+            colors=(0, 0, 0),  # Mid-gray, as fillColor='gray'
+            colorSpace='rgb'
+        )
+        
         # Create trial list (randomized order of difficulties)
         self.trials = (['hard'] * HARD_ROUNDS + ['medium'] * MEDIUM_ROUNDS)
         random.shuffle(self.trials)
@@ -186,8 +258,7 @@ class MemoryGame:
         ]
         
         for cmd in commands:
-            self.el_tracker.sendCommand(cmd)
-            pylink.msecDelay(10)
+            self.el_tracker.sendCommand(cmd)  # Blocks until sent, so no settling delay is needed
         
         print("✓ EyeLink configured")
     
@@ -214,6 +285,12 @@ class MemoryGame:
         if os.path.exists('images/fixTarget.bmp'):
             self.genv.setTargetType('picture')
             self.genv.setPictureTarget(os.path.join('images', 'fixTarget.bmp'))
+            
+            # Decode and draw the bitmap once off-screen, so the file is cached and the
+            # image path is warm before the first calibration target appears
+            warm_target = visual.ImageStim(self.win, image=os.path.join('images', 'fixTarget.bmp'))
+            warm_target.draw()
+            self.win.clearBuffer()
         
         self.genv.setCalibrationSounds('', '', '')
         
@@ -237,7 +314,8 @@ class MemoryGame:
                 
                 self.win.winHandle.activate()
                 self.win.flip()
-                event.clearEvents()
+                event.clearEvents(eventType='keyboard')
+                self.kb.clearEvents()
                 
             except RuntimeError as err:
                 print('Calibration ERROR:', err)
@@ -245,45 +323,109 @@ class MemoryGame:
                 self.win.winHandle.activate()
                 self.win.flip()
     
-    def _update_gaze_display(self):
-        """Update local gaze marker display"""
-        self.gaze_stats['total_attempts'] += 1
-        
-        try:
-            sample = self.el_tracker.getNewestSample()
-        except:
-            sample = None
-        
-        if sample is not None:
-            gaze_data = None
-            if sample.isRightSample():
-                try:
-                    gaze_data = sample.getRightEye().getGaze()
-                except:
-                    pass
-            elif sample.isLeftSample():
+    def _start_gaze_worker(self):
+        """Start polling the tracker on a background thread"""
+        self._gaze_running = True
+        self._gaze_thread = threading.Thread(target=self._gaze_worker, daemon=True)
+        self._gaze_thread.start()
+    
+    def _stop_gaze_worker(self):
+        """Stop the polling thread before the tracker goes offline"""
+        self._gaze_running = False
+        if self._gaze_thread is not None:
+            self._gaze_thread.join(timeout=1.0)
+            self._gaze_thread = None
+        with self._tracker_lock:
+            self._flush_messages()
+    
+    def _send_message(self, msg, sync=False):
+        """Send an EyeLink message; unless sync, queue it for the polling thread"""
+        if sync or not self._gaze_running:
+            with self._tracker_lock:
+                self._flush_messages()  # Keep queued messages ahead of this one
+                self.el_tracker.sendMessage(msg)
+        else:
+            self._message_queue.put((core.getTime(), msg))
+    
+    def _flush_messages(self):
+        """Send queued messages; call with _tracker_lock held"""
+        while True:
+            try:
+                queued_time, msg = self._message_queue.get_nowait()
+            except queue.Empty:
+                return
+            # A leading integer tells EyeLink the event happened that many ms before arrival;
+            # only added when non-zero, so messages sent promptly keep their original text
+            offset = int(round((core.getTime() - queued_time) * 1000))
+            try:
+                self.el_tracker.sendMessage(f"{offset} {msg}" if offset > 0 else msg)
+            except:
+                pass
+    
+    def _gaze_worker(self):
+        """Poll EyeLink for new samples and queue their raw gaze"""
+        last_sample_time = None
+        while self._gaze_running:
+            with self._tracker_lock:
+                self._flush_messages()
                 try:
-                    gaze_data = sample.getLeftEye().getGaze()
+                    sample = self.el_tracker.getNewestSample()
                 except:
-                    pass
-            
-            if gaze_data and gaze_data[0] != pylink.MISSING_DATA and gaze_data[1] != pylink.MISSING_DATA:
-                self.gaze_stats['valid_gaze_data'] += 1
+                    sample = None
+            
+            # Skip samples already seen on a previous poll
+            if sample is not None and sample.getTime() == last_sample_time:
+                time.sleep(0.001)
+                continue
+            
+            self.gaze_stats['total_attempts'] += 1
+            
+            if sample is not None:
+                last_sample_time = sample.getTime()
+                gaze_data = None
+                if sample.isRightSample():
+                    try:
+                        gaze_data = sample.getRightEye().getGaze()
+                    except:
+                        pass
+                elif sample.isLeftSample():
+                    try:
+                        gaze_data = sample.getLeftEye().getGaze()
+                    except:
+                        pass
                 
-                # Convert coordinates for display
-                gaze_x = gaze_data[0] - self.scn_width/2
-                gaze_y = self.scn_height/2 - gaze_data[1]
-                
-                if abs(gaze_x) <= self.scn_width/2 and abs(gaze_y) <= self.scn_height/2:
-                    self.gaze_marker.setPos([gaze_x, gaze_y])
-                    
-                    # Animate sparkle
-                    sparkle_time = core.getTime()
-                    sparkle_offset_x = 8 * np.sin(sparkle_time * 3)
-                    sparkle_offset_y = 6 * np.cos(sparkle_time * 4)
-                    self.gaze_sparkle.setPos([gaze_x + sparkle_offset_x, gaze_y + sparkle_offset_y])
-            else:
-                self.gaze_stats['missing_data'] += 1
+                # Classify every sample here, so the statistics don't depend on what
+                # the bounded queue still holds when a frame drains it
+                if gaze_data and gaze_data[0] != pylink.MISSING_DATA and gaze_data[1] != pylink.MISSING_DATA:
+                    self.gaze_stats['valid_gaze_data'] += 1
+                    with self._gaze_lock:
+                        self._gaze_pending.append((gaze_data[0], gaze_data[1]))
+                else:
+                    self.gaze_stats['missing_data'] += 1
+            
+            time.sleep(0.001)
+    
+    def _update_gaze_display(self):
+        """Update local gaze marker display from the valid samples queued since the last frame"""
+        with self._gaze_lock:
+            if not self._gaze_pending:
+                return
+            raw = np.array(self._gaze_pending, dtype=np.float32)
+            self._gaze_pending.clear()
+        
+        # Convert coordinates for display and bounds-check the whole batch as one mask
+        screen = (raw - self._center) * self._flip_y
+        in_bounds = (np.abs(screen) <= self._center).all(axis=1)
+        
+        if in_bounds.any():
+            gaze_x, gaze_y = screen[in_bounds][-1]
+            self.gaze_marker.pos = (gaze_x, gaze_y)
+            
+            # Animate sparkle
+            sparkle_time = core.getTime()
+            sparkle_offset_x = 8 * math.sin(sparkle_time * 3)  # math, not np: scalars per frame
+            sparkle_offset_y = 6 * math.cos(sparkle_time * 4)
+            self.gaze_sparkle.pos = (gaze_x + sparkle_offset_x, gaze_y + sparkle_offset_y)
     
     def _draw_gaze_markers(self):
         """Draw gaze markers on screen"""
@@ -344,7 +486,7 @@ class MemoryGame:
                     
                     if os.path.exists(image_path):
                         try:
-                            img = visual.ImageStim(self.win, image=image_path)
+                            img = visual.ImageStim(self.win, image=image_path, size=(70, 70))
                             images[category_key].append(img)
                             if i == 0:  # Only print for first image of each category
                                 print(f"✓ Found {folder_name} images")
@@ -356,72 +498,67 @@ class MemoryGame:
                 print(f"No images found for {category_key}. Using colored rectangles.")
                 colors = {'face': 'yellow', 'limb': 'green', 'house': 'blue', 'car': 'red'}
                 for i in range(10):
-                    rect = visual.Rect(self.win, width=80, height=80, fillColor=colors[category_key])
+                    rect = visual.Rect(self.win, width=70, height=70, fillColor=colors[category_key])  # Cell size, as the images
                     images[category_key].append(rect)
         
+        # Draw every stimulus once into the back buffer so textures and vertex data are
+        # on the GPU before the first trial, instead of stalling its first frame
+        for stims in images.values():
+            for stim in stims:
+                stim.draw()
+        self.win.clearBuffer()
+        print("✓ Stimuli preloaded")
+        
         return images
     
     def _calculate_grid_positions(self):
-        """Calculate pixel positions for 8x8 grid"""
-        positions = []
+        """Calculate pixel positions for 8x8 grid as a (64, 2) float32 array, row by row"""
         start_x = -280  # Start position for grid
         start_y = 280
         spacing = 80    # Space between grid items
         
-        for row in range(GRID_SIZE):
-            for col in range(GRID_SIZE):
-                x = start_x + col * spacing
-                y = start_y - row * spacing
-                positions.append((x, y))
-        
-        return positions
+        xs, ys = np.meshgrid(start_x + spacing * np.arange(GRID_SIZE),
+                             start_y - spacing * np.arange(GRID_SIZE))
+        return np.stack([xs.ravel(), ys.ravel()], axis=1).astype(np.float32)
     
     def _create_grid_from_condition(self, condition, difficulty):
-        """Create grid from condition array"""
-        grid_images = []
-        grid_image_indices = []  # Track which specific image was used
+        """Create grid from condition array
+        
+        Returns (grid_cat, grid_sel): 64-element row-major arrays of category
+        numbers and the image index chosen within each category.
+        """
+        cat_idx = np.asarray(condition, dtype=np.int8)
+        counts = self.image_counts  # Upper bounds per category, so one randint call draws every selection
         
         if difficulty == 'medium':
-            # condition is a 16-element array representing 4x4 pattern
-            # Convert numbers to categories
-            condition_categories = [CATEGORY_MAP[num] for num in condition]
-            
-            # Each position in 4x4 becomes a 2x2 block in 8x8
-            for med_row in range(4):
-                for med_col in range(4):
-                    category = condition_categories[med_row * 4 + med_col]
-                    # Randomly select one image from this category
-                    selected_image_idx = random.randint(0, len(self.images[category]) - 1)
-                    
-                    # Fill 2x2 block with this image
-                    for block_row in range(2):
-                        for block_col in range(2):
-                            grid_images.append(self.images[category][selected_image_idx])
-                            grid_image_indices.append((category, selected_image_idx))
+            # condition is a 4x4 pattern; each position becomes a 2x2 block with one image
+            cat_blocks = cat_idx.reshape(4, 4)
+            sel_blocks = np.random.randint(0, counts[cat_blocks])
+            grid_cat = cat_blocks.repeat(2, axis=0).repeat(2, axis=1).ravel()
+            grid_sel = sel_blocks.repeat(2, axis=0).repeat(2, axis=1).ravel()
         
         else:  # hard
-            # condition is a 64-element array representing 8x8 pattern
-            # Convert numbers to categories and use directly
-            condition_categories = [CATEGORY_MAP[num] for num in condition]
-            
-            # Each position maps directly to 8x8 grid
-            for i in range(64):
-                category = condition_categories[i]
-                # Randomly select one image from this category
-                selected_image_idx = random.randint(0, len(self.images[category]) - 1)
-                
-                grid_images.append(self.images[category][selected_image_idx])
-                grid_image_indices.append((category, selected_image_idx))
+            # condition is a 64-element 8x8 pattern that maps directly to the grid
+            grid_cat = cat_idx
+            grid_sel = np.random.randint(0, counts[grid_cat])
         
-        return grid_images, grid_image_indices
+        return grid_cat, grid_sel
     
-    def _display_grid(self, grid_images):
-        """Display the image grid with gaze tracking"""
-        for i, img in enumerate(grid_images):
+    def _build_grid_stim(self, grid_cat, grid_sel):
+        """Render the trial's 64 cells once and capture them as a single BufferImageStim"""
+        # Cells share stims (one per selected image), so each is positioned and drawn in turn
+        self.win.clearBuffer()
+        for i, img in enumerate(self.images_array[grid_cat, grid_sel]):
             x, y = self.grid_positions[i]
             img.pos = (x, y)
-            img.size = (70, 70)  # Slightly smaller than cover
             img.draw()
+        grid_stim = visual.BufferImageStim(self.win)
+        self.win.clearBuffer()
+        return grid_stim
+    
+    def _display_grid(self, grid_stim):
+        """Display the image grid with gaze tracking"""
+        grid_stim.draw()  # All 64 cells in one textured quad
         
         # Update and draw gaze markers
         self._update_gaze_display()
@@ -429,49 +566,33 @@ class MemoryGame:
     
     def _display_covers(self, target_index):
         """Display gray covers over all positions, with ?? over target"""
-        for i in range(64):
-            x, y = self.grid_positions[i]
-            self.gray_cover.pos = (x, y)
-            self.gray_cover.draw()
-            
-            # Draw question mark over target position
-            if i == target_index:
-                self.question_mark.pos = (x, y - 50)  # Position above the square
-                self.question_mark.draw()
+        self.cover_stim.draw()
+        
+        # Draw question mark over target position
+        x, y = self.grid_positions[target_index]
+        self.question_mark.pos = (x, y - 50)  # Position above the square
+        self.question_mark.draw()
         
         # Update and draw gaze markers
         self._update_gaze_display()
         self._draw_gaze_markers()
     
-    def _get_user_response(self):
+    def _build_response_stim(self, target_index):
+        """Capture the covers, ?? over the target and the instruction text as one BufferImageStim"""
+        # None of these change while waiting, so the response loop redraws only this texture
+        x, y = self.grid_positions[target_index]
+        self.question_mark.pos = (x, y - 50)
+        response_bg = visual.BufferImageStim(self.win, stim=[self.cover_stim, self.question_mark, self.response_instr])
+        self.win.clearBuffer()
+        return response_bg
+    
+    def _get_user_response(self, response_bg):
         """Get user response with gaze tracking display"""
         response_timer = core.Clock()
         
         while True:
             # Update gaze display while waiting for response
-            self.win.clearBuffer()
-            
-            # Redraw covers and question mark
-            for i in range(64):
-                x, y = self.grid_positions[i]
-                self.gray_cover.pos = (x, y)
-                self.gray_cover.draw()
-            
-            # Find and redraw question mark (stored from previous call)
-            if hasattr(self, '_current_target_index'):
-                x, y = self.grid_positions[self._current_target_index]
-                self.question_mark.pos = (x, y - 50)
-                self.question_mark.draw()
-            
-            # Add instruction text
-            instruction_text = visual.TextStim(
-                self.win,
-                text="What was under the ?? marker?\nH=House, C=Car, F=Face, L=Limb",
-                pos=(0, -350),
-                color='white',
-                height=20
-            )
-            instruction_text.draw()
+            response_bg.draw()
             
             # Update and draw gaze markers
             self._update_gaze_display()
@@ -479,51 +600,47 @@ class MemoryGame:
             
             self.win.flip()
             
-            keys = event.getKeys(keyList=['h', 'c', 'f', 'l', 'escape'])
+            keys = self.kb.getKeys(keyList=['h', 'c', 'f', 'l', 'escape'], waitRelease=False)
             if keys:
-                if keys[0] == 'escape':
+                if keys[0].name == 'escape':
                     self._cleanup_eyelink()
                     core.quit()
-                return keys[0], response_timer.getTime()
-            core.wait(0.01)
+                return keys[0].name, response_timer.getTime()
     
     def run_trial(self, difficulty):
         """Run a single trial with eye tracking and stage timing"""
         # Send trial start message to EyeLink
-        self.el_tracker.sendMessage(f"TRIAL_START {self.current_round} {difficulty}")
+        self._send_message(f"TRIAL_START {self.current_round} {difficulty}", sync=True)
         
         # Select random condition based on difficulty
         condition = random.choice(self.conditions[difficulty])
         
         # Create grid from condition
-        grid_images, grid_image_indices = self._create_grid_from_condition(condition, difficulty)
+        grid_cat, grid_sel = self._create_grid_from_condition(condition, difficulty)
+        grid_stim = self._build_grid_stim(grid_cat, grid_sel)  # Before STAGE1_START, so capture isn't timed
         
         # Choose random target position
         target_index = random.randint(0, 63)
-        target_category, target_image_idx = grid_image_indices[target_index]
+        target_category = CATEGORY_MAP[int(grid_cat[target_index])]
+        target_image_idx = int(grid_sel[target_index])
         self._current_target_index = target_index  # Store for gaze display
+        response_bg = self._build_response_stim(target_index)  # Also captured before any timed stage
         
         # Find correct key for target category
-        correct_key = None
-        for key, category in CATEGORIES.items():
-            if category == target_category:
-                correct_key = key
-                break
+        correct_key = KEY_FOR_CATEGORY[target_category]
         
         # STAGE 1 TIMING: Record start time
         stage1_start_time = core.getTime()
         stage1_start_timestamp = datetime.now().isoformat()
         
         # Send grid display message with precise timing
-        self.el_tracker.sendMessage(f"GRID_DISPLAY_START target_pos_{target_index} target_cat_{target_category} time_{stage1_start_time:.6f}")
+        self._send_message(f"GRID_DISPLAY_START target_pos_{target_index} target_cat_{target_category} time_{stage1_start_time:.6f}")
         
-        # Display images for DISPLAY_TIME seconds with gaze tracking
-        display_timer = core.Clock()
-        while display_timer.getTime() < DISPLAY_TIME:
-            self.win.clearBuffer()
-            self._display_grid(grid_images)
+        # Display images for DISPLAY_TIME seconds with gaze tracking; each flip waits for
+        # vsync, so counting frames gives the duration without an overshooting extra frame
+        for _ in range(int(round(DISPLAY_TIME * self.frame_rate))):
+            self._display_grid(grid_stim)
             self.win.flip()
-            core.wait(0.016)  # ~60 FPS
         
         # STAGE 1 TIMING: Record end time
         stage1_end_time = core.getTime()
@@ -531,32 +648,24 @@ class MemoryGame:
         stage1_duration = stage1_end_time - stage1_start_time
         
         # Send grid display end message with precise timing
-        self.el_tracker.sendMessage(f"GRID_DISPLAY_END time_{stage1_end_time:.6f} duration_{stage1_duration:.6f}")
+        self._send_message(f"GRID_DISPLAY_END time_{stage1_end_time:.6f} duration_{stage1_duration:.6f}")
         
         # Display covers with question mark and get response
-        self.win.clearBuffer()
         self._display_covers(target_index)
         
         # Add instruction text
-        instruction_text = visual.TextStim(
-            self.win,
-            text="What was under the ?? marker?\nH=House, C=Car, F=Face, L=Limb",
-            pos=(0, -350),
-            color='white',
-            height=20
-        )
-        instruction_text.draw()
+        self.response_instr.draw()
         self.win.flip()
         
         # Send response phase message
         response_start_time = core.getTime()
-        self.el_tracker.sendMessage(f"RESPONSE_START time_{response_start_time:.6f}")
+        self._send_message(f"RESPONSE_START time_{response_start_time:.6f}")
         
         # Get response and measure time
-        user_response, response_time = self._get_user_response()
+        user_response, response_time = self._get_user_response(response_bg)
         
         # Send response message
-        self.el_tracker.sendMessage(f"RESPONSE {user_response} RT_{response_time:.3f}")
+        self._send_message(f"RESPONSE {user_response} RT_{response_time:.3f}")
         
         # Check if correct
         correct = user_response == correct_key
@@ -569,7 +678,7 @@ class MemoryGame:
             feedback_color = 'red'
         
         # Send trial result message
-        self.el_tracker.sendMessage(f"TRIAL_RESULT {'CORRECT' if correct else 'INCORRECT'}")
+        self._send_message(f"TRIAL_RESULT {'CORRECT' if correct else 'INCORRECT'}")
         
         # Record trial data WITH STAGE 1 TIMING
         trial_record = {
@@ -591,65 +700,53 @@ class MemoryGame:
             'stage1_end_timestamp': stage1_end_timestamp,
             'stage1_duration': stage1_duration
         }
-        self.trial_data.append(trial_record)
+        self._data_writer.writerow(trial_record)
         
         # Show feedback with gaze tracking
+        self.feedback_text.text = feedback
+        self.feedback_text.color = feedback_color
         feedback_timer = core.Clock()
         while feedback_timer.getTime() < 1.5:
-            self.win.clearBuffer()
-            
-            feedback_text = visual.TextStim(
-                self.win,
-                text=feedback,
-                color=feedback_color,
-                height=30
-            )
-            feedback_text.draw()
+            self.feedback_text.draw()
             
             # Update and draw gaze markers
             self._update_gaze_display()
             self._draw_gaze_markers()
             
             self.win.flip()
-            core.wait(0.016)
         
         # Send trial end message
-        self.el_tracker.sendMessage(f"TRIAL_END {self.current_round}")
+        self._send_message(f"TRIAL_END {self.current_round}", sync=True)
         
         return correct
     
-    def _save_data(self):
-        """Save trial data to CSV file"""
-        if not self.trial_data:
-            return
-        
+    def _open_data_file(self):
+        """Open the trial CSV file for the session and write its header"""
         # Create filename with timestamp
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"memory_game_hard_data_{timestamp}.csv"
-        
-        # Define CSV columns - UPDATED to include stage timing
-        fieldnames = [
-            'trial', 'difficulty', 'condition', 'target_category', 
-            'target_image_index', 'target_position', 'correct_key', 
-            'user_response', 'response_time', 'correct', 'timestamp',
-            # NEW STAGE 1 TIMING FIELDS
-            'stage1_start_time', 'stage1_end_time', 
-            'stage1_start_timestamp', 'stage1_end_timestamp', 'stage1_duration'
-        ]
+        self.data_filename = f"memory_game_hard_data_{timestamp}.csv"
+        
+        # Line buffered, so every row is on disk once its trial ends, even if the game crashes
+        self._data_file = open(self.data_filename, 'w', newline='', encoding='utf-8', buffering=1)
+        self._data_writer = csv.DictWriter(self._data_file, fieldnames=DATA_FIELDNAMES)
+        self._data_writer.writeheader()
+    
+    def _save_data(self):
+        """Close the trial CSV file; rows were already written trial by trial"""
+        if self._data_file.closed:
+            return
         
         try:
-            with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(self.trial_data)
-            
-            print(f"Data saved to {filename}")
+            self._data_file.close()
+            print(f"Data saved to {self.data_filename}")
             
         except Exception as e:
             print(f"Error saving data: {e}")
     
     def _cleanup_eyelink(self):
         """Clean up EyeLink connection and save data"""
+        self._stop_gaze_worker()
+        self._save_data()
         if self.el_tracker and self.el_tracker.isConnected():
             try:
                 if self.el_tracker.isRecording():
@@ -683,7 +780,6 @@ class MemoryGame:
     def show_instructions(self):
         """Show game instructions with gaze tracking"""
         while True:
-            self.win.clearBuffer()
             self.instructions.draw()
             
             # Update and draw gaze markers
@@ -693,15 +789,13 @@ class MemoryGame:
             self.win.flip()
             
             # Wait for spacebar
-            keys = event.getKeys(keyList=['space', 'escape'])
+            keys = self.kb.getKeys(keyList=['space', 'escape'], waitRelease=False)
             if keys:
-                if keys[0] == 'escape':
+                if keys[0].name == 'escape':
                     self._cleanup_eyelink()
                     core.quit()
-                elif keys[0] == 'space':
+                elif keys[0].name == 'space':
                     break
-            
-            core.wait(0.016)
     
     def show_final_score(self):
         """Show final score with gaze tracking"""
@@ -713,21 +807,10 @@ class MemoryGame:
             wrapWidth=600
         )
         
-        while True:
-            self.win.clearBuffer()
-            score_text.draw()
-            
-            # Update and draw gaze markers
-            self._update_gaze_display()
-            self._draw_gaze_markers()
-            
-            self.win.flip()
-            
-            keys = event.getKeys(keyList=['space', 'escape'])
-            if keys:
-                break
-            
-            core.wait(0.016)
+        # Static screen: draw once and block until a key, rather than redrawing every frame
+        score_text.draw()
+        self.win.flip()
+        event.waitKeys(keyList=['space', 'escape'])
     
     def run_game(self):
         """Run the complete game with eye tracking"""
@@ -737,7 +820,8 @@ class MemoryGame:
             
             # Start recording
             self.el_tracker.startRecording(1, 1, 1, 1)
-            self.el_tracker.sendMessage("GAME_START")
+            self._start_gaze_worker()
+            self._send_message("GAME_START", sync=True)
             
             # Show instructions
             self.show_instructions()
@@ -747,33 +831,17 @@ class MemoryGame:
                 self.current_round = round_num + 1
                 difficulty = self.trials[round_num]
                 
-                # Show round info with gaze tracking
-                round_text = visual.TextStim(
-                    self.win,
-                    text=f"Round {self.current_round}/{TOTAL_ROUNDS}\nDifficulty: {difficulty.upper()}\n\nPress SPACE when ready",
-                    color='white',
-                    height=30
-                )
+                # Show round info; the one round_text stim is re-laid out only here, once per round
+                self.round_text.text = f"Round {self.current_round}/{TOTAL_ROUNDS}\nDifficulty: {difficulty.upper()}\n\nPress SPACE when ready"
                 
-                while True:
-                    self.win.clearBuffer()
-                    round_text.draw()
-                    
-                    # Update and draw gaze markers
-                    self._update_gaze_display()
-                    self._draw_gaze_markers()
-                    
-                    self.win.flip()
-                    
-                    keys = event.getKeys(keyList=['space', 'escape'])
-                    if keys:
-                        if keys[0] == 'escape':
-                            self._cleanup_eyelink()
-                            core.quit()
-                        elif keys[0] == 'space':
-                            break
-                    
-                    core.wait(0.016)
+                # Static screen: draw once and block until a key, rather than redrawing every frame
+                self.round_text.draw()
+                self.win.flip()
+                
+                keys = event.waitKeys(keyList=['space', 'escape'])
+                if keys[0] == 'escape':
+                    self._cleanup_eyelink()
+                    core.quit()
                 
                 # Run trial
                 self.run_trial(difficulty)
@@ -782,7 +850,8 @@ class MemoryGame:
                 core.wait(0.5)
             
             # End recording
-            self.el_tracker.sendMessage("GAME_END")
+            self._send_message("GAME_END", sync=True)
+            self._stop_gaze_worker()
             self.el_tracker.stopRecording()
             
             # Save data